@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""Micro-benchmarks for the github org client utilities.
+Run with ``python3 benchmarks.py``.
+"""
+import json
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable
+from urllib.parse import parse_qs, urlsplit
+
+from client import COMPACT_REPO_FIELDS
+from fixtures import TEST_PAYLOAD
+from utils import (
+    JSON_DECODERS,
+    access_nested_map,
+    compile_path,
+    decode_json,
+    get_json_paginated,
+    project,
+)
+
+
+class StubRepoHandler(BaseHTTPRequestHandler):
+    """Serve a paginated repos listing with a fixed per-request latency"""
+    total = 2000
+    latency = 0.05
+
+    def do_GET(self) -> None:
+        """Answer one page with GitHub style Link headers"""
+        parts = urlsplit(self.path)
+        query = parse_qs(parts.query)
+        per_page = int(query.get("per_page", ["30"])[0])
+        page = int(query.get("page", ["1"])[0])
+        last = -(-self.total // per_page)
+        start = (page - 1) * per_page
+        body = json.dumps([
+            {"name": "repo-{}".format(i)}
+            for i in range(start, min(start + per_page, self.total))
+        ]).encode()
+
+        url = "http://{}:{}{}?per_page={}&page={{}}".format(
+            *self.server.server_address, parts.path, per_page)
+        links = ['<{}>; rel="last"'.format(url.format(last))]
+        if page < last:
+            links.append('<{}>; rel="next"'.format(url.format(page + 1)))
+
+        time.sleep(self.latency)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Link", ", ".join(links))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args) -> None:
+        """Keep the benchmark output quiet"""
+
+
+class StubServer(ThreadingHTTPServer):
+    """Threaded stub server whose backlog fits every concurrent client"""
+    request_queue_size = 128
+
+
+def bench_pagination() -> None:
+    """Serial vs. concurrent page fetches against a local stub server"""
+    server = StubServer(("127.0.0.1", 0), StubRepoHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = "http://{}:{}/orgs/bench/repos".format(*server.server_address)
+    try:
+        for concurrency in (1, 4, 8, 16):
+            start = time.perf_counter()
+            repos = get_json_paginated(url, per_page=100,
+                                       concurrency=concurrency)
+            elapsed = time.perf_counter() - start
+            print("pagination concurrency={:<3} repos={} {:.3f}s".format(
+                concurrency, len(repos), elapsed))
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def bench_projection(copies: int = 500) -> None:
+    """Memory held by full repo dicts vs. compact projected records"""
+    data = json.dumps(TEST_PAYLOAD[0][1] * copies)
+    tracemalloc.start()
+    full = json.loads(data)
+    full_bytes = tracemalloc.get_traced_memory()[0]
+    compact = project(full, COMPACT_REPO_FIELDS)
+    del full
+    compact_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print("projection repos={} full={}KiB compact={}KiB ({:.0f}x)".format(
+        len(compact), full_bytes // 1024, compact_bytes // 1024,
+        full_bytes / compact_bytes))
+
+
+def bench_decoders(copies: int = 500, repeat: int = 5) -> None:
+    """Decode time and peak allocations per JSON decoder"""
+    data = json.dumps(TEST_PAYLOAD[0][1] * copies).encode()
+    variants = [("json via str", lambda: json.loads(data.decode()))]
+    variants += [(name, lambda name=name: decode_json(data, name))
+                 for name in JSON_DECODERS]
+    for name, decode in variants:
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            decode()
+            best = min(best, time.perf_counter() - start)
+        tracemalloc.start()
+        decode()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print("decode {:<12} {}KiB body {:.1f}ms peak={}KiB".format(
+            name, len(data) // 1024, best * 1000, peak // 1024))
+
+
+def bench_access(copies: int = 2000, repeat: int = 5) -> None:
+    """access_nested_map vs. a compiled accessor over many repos"""
+    repos = TEST_PAYLOAD[0][1] * copies
+    path = ("license", "key")
+    license_key = compile_path(path)
+
+    def interpreted():
+        for repo in repos:
+            try:
+                access_nested_map(repo, path)
+            except KeyError:
+                pass
+
+    def compiled():
+        for repo in repos:
+            try:
+                license_key(repo)
+            except KeyError:
+                pass
+
+    for name, run in (("interpreted", interpreted), ("compiled", compiled)):
+        best = min(_timed(run) for _ in range(repeat))
+        print("access {:<12} repos={} {:.1f}ms".format(
+            name, len(repos), best * 1000))
+
+
+def _timed(run: Callable[[], Any]) -> float:
+    """Seconds one call of run takes"""
+    start = time.perf_counter()
+    run()
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    bench_pagination()
+    bench_projection()
+    bench_decoders()
+    bench_access()
@@ -1,28 +1,327 @@
 #!/usr/bin/env python3
 """A github org client
 """
+import heapq
+from bisect import bisect_left
+import math
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from operator import attrgetter
 from typing import (
     List,
     Dict,
+    Any,
+    Callable,
+    Mapping,
+    Iterable,
+    Iterator,
+    NamedTuple,
+    Sequence,
+    Tuple,
 )
 
 from utils import (
+    access_nested_map_many,
+    async_get_json,
+    async_get_json_paginated,
+    async_memoize,
     get_json,
-    access_nested_map,
+    get_json_paginated,
+    iter_json,
+    compile_path,
     memoize,
+    memo_registry,
+    project,
 )
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
-class GithubOrgClient:
-    """A Githib org client
+# top_repos key aliases, other keys name a top level repo field
+TOP_REPO_KEYS = {
+    "stars": "stargazers_count",
+    "forks": "forks_count",
+    "issues": "open_issues_count",
+    "pushed": "pushed_at",
+}
+
+COMPACT_REPO_FIELDS = (
+    "name", "license.key", "fork", "archived", "language", "visibility",
+    "private", "stargazers_count", "forks_count", "open_issues_count",
+    "size", "pushed_at",
+)
+
+
+_license_key_of = compile_path(("license", "key"))
+
+# repo_stats column name to key path, numeric columns are typed
+_STAT_PATHS = {
+    "license": ("license", "key"),
+    "language": ("language",),
+    "stars": ("stargazers_count",),
+    "forks": ("forks_count",),
+    "issues": ("open_issues_count",),
+    "size": ("size",),
+}
+_STAT_TYPECODES = {"stars": "q", "forks": "q", "issues": "q", "size": "q"}
+
+
+def _percentile(ordered: Sequence[float], percent: float) -> float:
+    """Linearly interpolated percentile of sorted values, like NumPy's"""
+    rank = (len(ordered) - 1) * percent / 100
+    low, high = math.floor(rank), math.ceil(rank)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def _summary(column: Sequence[int],
+             percentiles: Sequence[float]) -> Dict[str, Any]:
+    """Total, extremes, mean and percentiles of a numeric column"""
+    if not len(column):
+        return {"total": 0, "min": None, "max": None, "mean": None,
+                "percentiles": {p: None for p in percentiles}}
+    if numpy is not None:
+        values = numpy.frombuffer(column, dtype=column.typecode)
+        points = numpy.percentile(values, percentiles).tolist()
+        return {"total": int(values.sum()), "min": int(values.min()),
+                "max": int(values.max()), "mean": float(values.mean()),
+                "percentiles": dict(zip(percentiles, points))}
+    ordered = sorted(column)
+    total = sum(ordered)
+    return {"total": total, "min": ordered[0], "max": ordered[-1],
+            "mean": total / len(ordered),
+            "percentiles": {p: float(_percentile(ordered, p))
+                            for p in percentiles}}
+
+
+class RepoFilter:
+    """A repo predicate compiled into a closure.
+    Filters combine with ``&`` (and), ``|`` (or) and ``~`` (not) into new
+    compiled filters; build the leaves with ``where``.
+    """
+    __slots__ = ("test",)
+
+    def __init__(self, test: Callable[[Mapping], bool]) -> None:
+        """Init method of RepoFilter"""
+        self.test = test
+
+    def __call__(self, repo: Mapping) -> bool:
+        """Whether repo matches"""
+        return self.test(repo)
+
+    def __and__(self, other: "RepoFilter") -> "RepoFilter":
+        """Match repos matching both filters"""
+        left, right = self.test, other.test
+        return RepoFilter(lambda repo: left(repo) and right(repo))
+
+    def __or__(self, other: "RepoFilter") -> "RepoFilter":
+        """Match repos matching either filter"""
+        left, right = self.test, other.test
+        return RepoFilter(lambda repo: left(repo) or right(repo))
+
+    def __invert__(self) -> "RepoFilter":
+        """Match repos not matching this filter"""
+        test = self.test
+        return RepoFilter(lambda repo: not test(repo))
+
+
+def _license_key(repo: Mapping) -> Any:
+    """License key of repo, None when it has no license"""
+    try:
+        return repo["license"]["key"]
+    except (KeyError, TypeError):
+        return None
+
+
+def _visibility(repo: Mapping) -> str:
+    """Visibility of repo, derived from ``private`` on older payloads"""
+    visibility = repo.get("visibility")
+    if visibility is None:
+        return "private" if repo.get("private") else "public"
+    return visibility
+
+
+def _match(get: Callable[[Mapping], Any], value: Any) -> Callable:
+    """Compile an equality, or a membership test for set-like values"""
+    if isinstance(value, (set, frozenset, list, tuple)):
+        values = frozenset(value)
+        return lambda repo: get(repo) in values
+    return lambda repo: get(repo) == value
+
+
+def _field(name: str) -> Callable[[Mapping], Any]:
+    """Getter of a top level repo field, None when missing"""
+    return lambda repo: repo.get(name)
+
+
+def where(**conditions: Any) -> RepoFilter:
+    """Compile conditions, all of which must hold, into a RepoFilter.
+    Parameters
+    ----------
+    fork, archived: bool
+        match forks / archived repos, or exclude them when False
+    language, visibility, license: str or set of str
+        match one value or any value of a set; ``None`` stands for no
+        language or no license
+    min_stars, max_stars: int
+        inclusive bounds on ``stargazers_count``
+    Example
+    -------
+    >>> apache_or_mit = where(license={"apache-2.0", "mit"})
+    >>> client.select(apache_or_mit & ~where(fork=True, archived=True))
+    """
+    checks = []
+    for name, value in conditions.items():
+        if name in ("fork", "archived"):
+            checks.append(_match(_field(name), bool(value)))
+        elif name == "language":
+            checks.append(_match(_field(name), value))
+        elif name == "visibility":
+            checks.append(_match(_visibility, value))
+        elif name == "license":
+            checks.append(_match(_license_key, value))
+        elif name == "min_stars":
+            checks.append(
+                lambda repo, low=value: (repo.get("stargazers_count")
+                                         or 0) >= low)
+        elif name == "max_stars":
+            checks.append(
+                lambda repo, high=value: (repo.get("stargazers_count")
+                                          or 0) <= high)
+        else:
+            raise TypeError("unknown repo condition {!r}".format(name))
+
+    if len(checks) == 1:
+        return RepoFilter(checks[0])
+    checks = tuple(checks)
+
+    def test(repo: Mapping) -> bool:
+        """Whether repo passes every check"""
+        for check in checks:
+            if not check(repo):
+                return False
+        return True
+    return RepoFilter(test)
+
+
+class OrgResult(NamedTuple):
+    """Outcome of one org of GithubOrgClient.fetch_many.
+    ``org`` and ``repos`` are the org and repos payloads, None past a
+    failure, which is then kept in ``error``.
+    """
+    name: str
+    org: Dict = None
+    repos: List = None
+    error: Exception = None
+
+
+class BaseGithubOrgClient:
+    """Settings and construction shared by GithubOrgClient and
+    AsyncGithubOrgClient. Override a setting here to change it for both,
+    or on one client class alone.
     """
     ORG_URL = "https://api.github.com/orgs/{org}"
+    MAX_PER_PAGE = 100
+    PER_PAGE = MAX_PER_PAGE
+    PAGE_CONCURRENCY = 8
+    # dotted field paths to keep per repo, None keeps the full payload
+    REPO_FIELDS = None
+    # seconds after which org and repos_payload are served stale while
+    # they refresh in the background, and after which callers wait for
+    # the refresh; None disables either
+    CACHE_REFRESH_AFTER = 300
+    CACHE_TTL = 3600
 
-    def __init__(self, org_name: str) -> None:
-        """Init method of GithubOrgClient"""
+    def __init__(self, org_name: str, per_page: int = None,
+                 concurrency: int = None) -> None:
+        """Init method of BaseGithubOrgClient"""
+        if per_page is None:
+            per_page = self.PER_PAGE
+        if not 1 <= per_page <= self.MAX_PER_PAGE:
+            raise ValueError("per_page must be between 1 and {}".format(
+                self.MAX_PER_PAGE))
         self._org_name = org_name
+        self._per_page = per_page
+        self._concurrency = (self.PAGE_CONCURRENCY if concurrency is None
+                             else concurrency)
 
-    @memoize
+    @classmethod
+    def invalidate(cls, org_name: str = None) -> int:
+        """Drop the shared cached data of one org, or of every org"""
+        return memo_registry.invalidate(cls, key=org_name)
+
+    @staticmethod
+    def has_license(repo: Dict[str, Dict], license_key: str) -> bool:
+        """Static: has_license"""
+        assert license_key is not None, "license_key cannot be None"
+        try:
+            has_license = _license_key_of(repo) == license_key
+        except KeyError:
+            return False
+        return has_license
+
+
+class GithubOrgClient(BaseGithubOrgClient):
+    """A Githib org client
+    """
+
+    @classmethod
+    def fetch_many(cls, orgs: Iterable[str], concurrency: int = 8,
+                   per_page: int = None,
+                   page_concurrency: int = 1) -> Iterator[OrgResult]:
+        """Fetch the org and repos payloads of many orgs on a thread pool.
+        Each org's repos fetch is started as soon as its org (and so its
+        repos URL) resolves, and an OrgResult is yielded per org as soon
+        as both are in, in completion order. At most ``concurrency``
+        fetches run at a time; orgs are read from ``orgs`` lazily and
+        pending repos fetches go before new orgs. A failing org yields
+        its error instead of aborting the batch.
+        ``per_page`` and ``page_concurrency`` configure each client.
+        Up to ``concurrency * page_concurrency`` requests run at once, so
+        keep that within ``transport.pool_maxsize`` (16): connections
+        past it are not kept alive. Pages are therefore fetched one at a
+        time per org by default, the orgs providing the parallelism.
+        Example
+        -------
+        >>> for result in GithubOrgClient.fetch_many(names, concurrency=16):
+        ...     if result.error is None:
+        ...         store(result.name, result.repos)
+        """
+        orgs = iter(orgs)
+        pending = {}
+        with ThreadPoolExecutor(concurrency) as executor:
+
+            def fill() -> None:
+                """Start org fetches until every worker is busy"""
+                while len(pending) < concurrency:
+                    name = next(orgs, None)
+                    if name is None:
+                        return
+                    client = cls(name, per_page, page_concurrency)
+                    future = executor.submit(getattr, client, "org")
+                    pending[future] = (client, None)
+
+            fill()
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    client, org = pending.pop(future)
+                    error = future.exception()
+                    if error is not None:
+                        yield OrgResult(client._org_name, org, error=error)
+                    elif org is None:
+                        # org resolved, its repos go ahead of new orgs
+                        repos = executor.submit(getattr, client,
+                                                "repos_payload")
+                        pending[repos] = (client, future.result())
+                    else:
+                        yield OrgResult(client._org_name, org,
+                                        future.result())
+                fill()
+
+    @memoize(key=attrgetter("_org_name"), ttl="CACHE_TTL",
+             refresh_after="CACHE_REFRESH_AFTER")
     def org(self) -> Dict:
         """Memoize org"""
         return get_json(self.ORG_URL.format(org=self._org_name))
@@ -32,27 +331,177 @@ class GithubOrgClient:
         """Public repos URL"""
         return self.org["repos_url"]
 
-    @memoize
+    @memoize(key=attrgetter("_org_name"), ttl="CACHE_TTL",
+             refresh_after="CACHE_REFRESH_AFTER")
     def repos_payload(self) -> Dict:
-        """Memoize repos payload"""
-        return get_json(self._public_repos_url)
+        """Memoize repos payload, following every page.
+        Projected onto compact records when REPO_FIELDS is set, which must
+        then include "name" and "license.key".
+        """
+        payload = get_json_paginated(self._public_repos_url,
+                                     per_page=self._per_page,
+                                     concurrency=self._concurrency)
+        if self.REPO_FIELDS is not None:
+            return project(payload, self.REPO_FIELDS)
+        return payload
+
+    @memoize(key=attrgetter("_org_name"), depends_on="repos_payload")
+    def _license_index(self) -> Dict[str, List[str]]:
+        """Repo names by license key, unlicensed repos under None.
+        Built once per repos payload, rebuilt when it is refreshed.
+        """
+        index = {}
+        for repo in self.repos_payload:
+            try:
+                license_key = _license_key_of(repo)
+            except KeyError:
+                license_key = None
+            index.setdefault(license_key, []).append(repo["name"])
+        return index
+
+    @memoize(key=attrgetter("_org_name"), depends_on="repos_payload")
+    def _repo_columns(self) -> Dict[str, Any]:
+        """Columns of _STAT_PATHS over the repos payload"""
+        return access_nested_map_many(
+            self.repos_payload, _STAT_PATHS, default=None,
+            typecodes=_STAT_TYPECODES,
+            defaults=dict.fromkeys(_STAT_TYPECODES, 0))
+
+    def repo_stats(self, percentiles: Sequence[float] = (50, 90, 99)
+                   ) -> Dict[str, Any]:
+        """Statistics over every repo of the org.
+        Returns the repo count, license and language histograms (None
+        counts unlicensed repos and repos without a language) and, for
+        stars, forks, open issues and size, the total, min, max, mean and
+        the requested percentiles. Uses NumPy when it is installed.
+        """
+        columns = self._repo_columns
+        stats = {
+            "repos": len(columns["license"]),
+            "licenses": dict(Counter(columns["license"])),
+            "languages": dict(Counter(columns["language"])),
+        }
+        for name in _STAT_TYPECODES:
+            stats[name] = _summary(columns[name], percentiles)
+        return stats
+
+    @memoize(key=attrgetter("_org_name"), depends_on="repos_payload")
+    def _top_index(self) -> Dict[str, List[str]]:
+        """Repo names ranked by field, largest first, filled by top_repos.
+        Each list is a ranked prefix of the payload, only as long as the
+        largest k asked for so far (at least doubling when it grows).
+        """
+        return {}
+
+    def top_repos(self, key: str = "stars", k: int = 20) -> List[str]:
+        """Names of the k repos with the largest key, largest first.
+        key is one of TOP_REPO_KEYS or a top level repo field; repos
+        missing it rank last. Ties keep payload order.
+        """
+        ranked = self._top_index
+        payload = self.repos_payload
+        field = TOP_REPO_KEYS.get(key, key)
+        names = ranked.get(field)
+        if names is None or k > len(names) < len(payload):
+            size = max(k, 2 * len(names)) if names else k
+
+            def rank(repo: Mapping) -> tuple:
+                """Sort key placing missing values last"""
+                value = repo.get(field)
+                return value is not None, value
+            names = [repo["name"]
+                     for repo in heapq.nlargest(size, payload, key=rank)]
+            ranked[field] = names
+        return names[:k]
+
+    @memoize(key=attrgetter("_org_name"), depends_on="repos_payload")
+    def _name_index(self) -> Tuple[List[str], List[str], List[str]]:
+        """Sorted casefolded names, the names in that order, and the
+        names sorted as they are
+        """
+        names = [repo["name"] for repo in self.repos_payload]
+        folded = sorted((name.casefold(), name) for name in names)
+        return ([key for key, _ in folded], [name for _, name in folded],
+                sorted(names))
+
+    def complete_repos(self, prefix: str, limit: int = 10,
+                       case_sensitive: bool = False) -> List[str]:
+        """Up to limit repo names starting with prefix, in sorted order.
+        Answered by bisecting a sorted name index, built once per repos
+        payload, in O(log n + limit).
+        """
+        folded_keys, folded_names, names = self._name_index
+        if case_sensitive:
+            keys = names
+        else:
+            keys, names, prefix = folded_keys, folded_names, prefix.casefold()
+        matches = []
+        for i in range(bisect_left(keys, prefix), len(keys)):
+            if len(matches) == limit or not keys[i].startswith(prefix):
+                break
+            matches.append(names[i])
+        return matches
 
     def public_repos(self, license: str = None) -> List[str]:
         """Public repos"""
-        json_payload = self.repos_payload
-        public_repos = [
-            repo["name"] for repo in json_payload
-            if license is None or self.has_license(repo, license)
-        ]
+        if license is None:
+            return [repo["name"] for repo in self.repos_payload]
+        return list(self._license_index.get(license, ()))
 
-        return public_repos
+    def iter_public_repos(self, license: str = None) -> Iterator[str]:
+        """Public repos, streamed page by page as they download.
+        Bypasses repos_payload, so memory stays bounded by one repo.
+        """
+        for repo in iter_json(self._public_repos_url, per_page=self._per_page):
+            if license is None or self.has_license(repo, license):
+                yield repo["name"]
 
-    @staticmethod
-    def has_license(repo: Dict[str, Dict], license_key: str) -> bool:
-        """Static: has_license"""
-        assert license_key is not None, "license_key cannot be None"
-        try:
-            has_license = access_nested_map(repo, ("license", "key")) == license_key
-        except KeyError:
-            return False
-        return has_license
+    def select(self, repo_filter: RepoFilter) -> List[str]:
+        """Names of the repos matching a compiled filter"""
+        test = repo_filter.test
+        return [repo["name"] for repo in self.repos_payload if test(repo)]
+
+    def select_many(self, **filters: RepoFilter) -> Dict[str, List[str]]:
+        """Names of the repos matching each named filter, in one pass"""
+        tests = [(name, repo_filter.test, [])
+                 for name, repo_filter in filters.items()]
+        for repo in self.repos_payload:
+            for _, test, names in tests:
+                if test(repo):
+                    names.append(repo["name"])
+        return {name: names for name, _, names in tests}
+
+
+class AsyncGithubOrgClient(BaseGithubOrgClient):
+    """asyncio Github org client.
+    Mirrors GithubOrgClient on top of async_get_json: memoized attributes
+    are awaited (``await client.org``) and concurrent awaiters share one
+    request.
+    """
+
+    @async_memoize(key=attrgetter("_org_name"), ttl="CACHE_TTL",
+                   refresh_after="CACHE_REFRESH_AFTER")
+    async def org(self) -> Dict:
+        """Memoize org"""
+        return await async_get_json(self.ORG_URL.format(org=self._org_name))
+
+    @property
+    async def _public_repos_url(self) -> str:
+        """Public repos URL"""
+        return (await self.org)["repos_url"]
+
+    @async_memoize(key=attrgetter("_org_name"), ttl="CACHE_TTL",
+                   refresh_after="CACHE_REFRESH_AFTER")
+    async def repos_payload(self) -> Dict:
+        """Memoize repos payload, following every page"""
+        payload = await async_get_json_paginated(
+            await self._public_repos_url, per_page=self._per_page,
+            concurrency=self._concurrency)
+        if self.REPO_FIELDS is not None:
+            return project(payload, self.REPO_FIELDS)
+        return payload
+
+    async def public_repos(self, license: str = None) -> List[str]:
+        """Public repos"""
+        return [repo["name"] for repo in await self.repos_payload
+                if license is None or self.has_license(repo, license)]
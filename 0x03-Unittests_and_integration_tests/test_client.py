@@ -1,14 +1,25 @@
 #!/usr/bin/env python3
 """Test suite for the GithubOrgClient class"""
+import asyncio
+import heapq
+import json
+import threading
 import unittest
 from parameterized import parameterized, parameterized_class
-from unittest.mock import patch, Mock
-from client import GithubOrgClient
+from unittest.mock import patch, Mock, PropertyMock
+from client import GithubOrgClient, where, COMPACT_REPO_FIELDS
+from client import AsyncGithubOrgClient, BaseGithubOrgClient, OrgResult
+from fixtures import TEST_PAYLOAD
+from utils import compile_path, LRUCache, validator_cache
 
 
 from parameterized import parameterized
 
 class TestGithubOrgClient(unittest.TestCase):
+    def setUp(self):
+        """Start every test with an empty shared cache"""
+        GithubOrgClient.invalidate()
+
     @parameterized.expand([
         ("google", {"repos_url": "https://api.github.com/orgs/google/repos"}),
         ("abc", {"repos_url": "https://api.github.com/orgs/abc/repos"})
@@ -83,6 +94,360 @@ class TestGithubOrgClient(unittest.TestCase):
             # Ensure that _public_repos_url was accessed once
             self.assertTrue(client._public_repos_url)
 
-    
+    @patch('client.get_json_paginated')
+    def test_repos_payload_paginates(self, mock_paginated):
+        """Test that repos_payload requests every page at per_page"""
+        mock_paginated.return_value = [{"name": "repo1"}]
+        url = "https://api.github.com/orgs/mock-org/repos"
+        with patch('client.GithubOrgClient._public_repos_url',
+                   new_callable=PropertyMock, return_value=url):
+            client = GithubOrgClient("mock-org", per_page=50)
+            self.assertEqual(client.public_repos(), ["repo1"])
+        mock_paginated.assert_called_once_with(url, per_page=50,
+                                               concurrency=8)
+
+    @patch('client.get_json')
+    def test_org_shared_between_instances(self, mock_get_json):
+        """Test that clients of one org share the memoized payload"""
+        mock_get_json.return_value = {"login": "google"}
+
+        self.assertEqual(GithubOrgClient("google").org, {"login": "google"})
+        self.assertEqual(GithubOrgClient("google").org, {"login": "google"})
+        mock_get_json.assert_called_once()
+
+        GithubOrgClient.invalidate("google")
+        GithubOrgClient("google").org
+        self.assertEqual(mock_get_json.call_count, 2)
+
+    @patch('client.get_json_paginated')
+    @patch('client.get_json', return_value=TEST_PAYLOAD[0][0])
+    def test_public_repos_license_index(self, mock_get_json, mock_paginated):
+        """Test that license filters share one index per payload"""
+        _, repos, expected_repos, apache2_repos = TEST_PAYLOAD[0]
+        mock_paginated.return_value = repos
+        client = GithubOrgClient("google")
+
+        with patch('client._license_key_of',
+                   wraps=compile_path(("license", "key"))) as mock_access:
+            self.assertEqual(client.public_repos(), expected_repos)
+            self.assertEqual(client.public_repos("apache-2.0"), apache2_repos)
+            self.assertEqual(client.public_repos("mit"), [])
+            self.assertEqual(GithubOrgClient("google").public_repos(
+                "bsd-3-clause"), ["episodes.dart"])
+        self.assertEqual(mock_access.call_count, len(repos))
+
+        mock_paginated.return_value = repos[:2]
+        GithubOrgClient.repos_payload.refresh(client)
+        self.assertEqual(client.public_repos("apache-2.0"), [])
+        self.assertEqual(client.public_repos("bsl-1.0"), ["cpp-netlib"])
+
+    @patch('client.get_json_paginated')
+    @patch('client.get_json', return_value=TEST_PAYLOAD[0][0])
+    def test_compact_repos_payload(self, mock_get_json, mock_paginated):
+        """Test that a projected payload keeps public_repos working"""
+        _, repos, expected_repos, apache2_repos = TEST_PAYLOAD[0]
+        mock_paginated.return_value = repos
+
+        class CompactClient(GithubOrgClient):
+            """Client keeping compact repo records"""
+            REPO_FIELDS = COMPACT_REPO_FIELDS
+
+        client = CompactClient("google")
+        payload = client.repos_payload
+
+        self.assertFalse(hasattr(payload[0], "__dict__"))
+        self.assertNotIn("owner", payload[0])
+        self.assertEqual(payload[0]["stargazers_count"], 12)
+        self.assertEqual(client.public_repos(), expected_repos)
+        self.assertEqual(client.public_repos("apache-2.0"), apache2_repos)
+        self.assertTrue(client.has_license(payload[2], "apache-2.0"))
+        self.assertFalse(client.has_license(payload[4], "apache-2.0"))
+        self.assertEqual(client.select(where(fork=True, language="Java")),
+                         ["dagger"])
+
+    @patch('client.iter_json')
+    def test_iter_public_repos(self, mock_iter_json):
+        """Test that streamed repos are filtered without repos_payload"""
+        mock_iter_json.return_value = iter(TEST_PAYLOAD[0][1])
+        with patch('client.GithubOrgClient._public_repos_url',
+                   new_callable=PropertyMock, return_value="url"):
+            client = GithubOrgClient("google", per_page=10)
+            names = list(client.iter_public_repos("apache-2.0"))
+
+        self.assertEqual(names, TEST_PAYLOAD[0][3])
+        mock_iter_json.assert_called_once_with("url", per_page=10)
+
+    @patch('client.get_json_paginated', return_value=TEST_PAYLOAD[0][1])
+    @patch('client.get_json', return_value=TEST_PAYLOAD[0][0])
+    def test_repo_stats(self, mock_get_json, mock_paginated):
+        """Test org statistics with and without NumPy"""
+        client = GithubOrgClient("google")
+
+        stats = client.repo_stats(percentiles=(0, 50, 100))
+        with patch('client.numpy', None):
+            self.assertEqual(client.repo_stats(percentiles=(0, 50, 100)),
+                             stats)
+
+        self.assertEqual(stats["repos"], 9)
+        self.assertEqual(stats["licenses"]["apache-2.0"], 4)
+        self.assertEqual(stats["licenses"][None], 1)
+        self.assertEqual(stats["languages"]["JavaScript"], 2)
+        self.assertEqual(stats["stars"]["total"], 27824)
+        self.assertEqual(stats["stars"]["percentiles"],
+                         {0: 12.0, 50: 280.0, 100: 14492.0})
+        self.assertEqual(stats["size"]["min"], 8)
+        self.assertEqual(stats["forks"]["max"], 1741)
+
+    @patch('client.get_json_paginated')
+    @patch('client.get_json', return_value=TEST_PAYLOAD[0][0])
+    def test_top_repos(self, mock_get_json, mock_paginated):
+        """Test top-k selection and its cached ranked prefixes"""
+        repos = TEST_PAYLOAD[0][1]
+        mock_paginated.return_value = repos
+        client = GithubOrgClient("google")
+
+        with patch('client.heapq.nlargest',
+                   wraps=heapq.nlargest) as mock_nlargest:
+            self.assertEqual(client.top_repos("stars", 2),
+                             ["dagger", "traceur-compiler"])
+            self.assertEqual(client.top_repos("stars", 1), ["dagger"])
+            self.assertEqual(GithubOrgClient("google").top_repos("stars", 2),
+                             ["dagger", "traceur-compiler"])
+            self.assertEqual(mock_nlargest.call_count, 1)
+            self.assertEqual(client.top_repos("stars", 3)[2],
+                             "ios-webkit-debug-proxy")
+            self.assertEqual(len(client.top_repos("stars", 50)), len(repos))
+            client.top_repos("stars", 50)
+            self.assertEqual(mock_nlargest.call_count, 3)
+
+        self.assertEqual(client.top_repos("forks", 1), ["dagger"])
+        self.assertEqual(client.top_repos("pushed", 1), ["google.github.io"])
+        self.assertEqual(client.top_repos("homepage", 9)[-1],
+                         "firmata.py")
+
+        mock_paginated.return_value = repos[:2]
+        GithubOrgClient.repos_payload.refresh(client)
+        self.assertEqual(client.top_repos("stars"),
+                         ["cpp-netlib", "episodes.dart"])
+
+    @parameterized.expand([
+        ("d", {}, ["dagger", "Dagger-Extras"]),
+        ("D", {"case_sensitive": True}, ["Dagger-Extras"]),
+        ("", {"limit": 3}, ["build-debian-cloud", "cpp-netlib", "dagger"]),
+        ("GOOGLE.", {}, ["google.github.io"]),
+        ("Kr", {"case_sensitive": True}, []),
+        ("kr", {"case_sensitive": True}, ["kratu"]),
+        ("x", {}, []),
+    ])
+    @patch('client.get_json_paginated')
+    @patch('client.get_json', return_value=TEST_PAYLOAD[0][0])
+    def test_complete_repos(self, prefix, options, expected,
+                            mock_get_json, mock_paginated):
+        """Test prefix completion over the memoized name index"""
+        repos = TEST_PAYLOAD[0][1] + [dict(TEST_PAYLOAD[0][1][1],
+                                           name="Dagger-Extras")]
+        mock_paginated.return_value = repos
+        client = GithubOrgClient("google")
+
+        self.assertEqual(client.complete_repos(prefix, **options), expected)
+
+        mock_paginated.return_value = repos[:1]
+        GithubOrgClient.repos_payload.refresh(client)
+        self.assertEqual(client.complete_repos(""), ["episodes.dart"])
+
+    @parameterized.expand([(0,), (101,)])
+    def test_per_page_bounds(self, per_page):
+        """Test that per_page outside GitHub's limits is rejected"""
+        with self.assertRaises(ValueError):
+            GithubOrgClient("mock-org", per_page=per_page)
+
+
+class TestRevalidation(unittest.TestCase):
+    """Test suite for refreshing memoized org data through the caches"""
+
+    def setUp(self):
+        """Start without memoized data or validators"""
+        GithubOrgClient.invalidate()
+        validator_cache.clear()
+
+    @patch('utils.transport.get')
+    def test_expiry_and_invalidate_reach_the_origin(self, mock_get):
+        """Test that recomputes send conditional requests past the
+        response cache and keep an unchanged org object
+        """
+        mock_get.side_effect = [
+            Mock(status_code=200, headers={"ETag": '"v1"'}, links={},
+                 content=json.dumps(TEST_PAYLOAD[0][0]).encode()),
+            Mock(status_code=304, headers={}),
+            Mock(status_code=304, headers={}),
+        ]
+        url = "https://api.github.com/orgs/google"
+        with patch('utils.response_cache', LRUCache(ttl=None)):
+            with patch('utils.time.monotonic', return_value=100.0):
+                org = GithubOrgClient("google").org
+            with patch('utils.time.monotonic', return_value=100.0 + 3601):
+                self.assertIs(GithubOrgClient("google").org, org)
+                GithubOrgClient.invalidate("google")
+                self.assertIs(GithubOrgClient("google").org, org)
+
+        self.assertEqual(mock_get.call_count, 3)
+        mock_get.assert_called_with(url, params=None,
+                                    headers={"If-None-Match": '"v1"'})
+
+
+class TestFetchMany(unittest.TestCase):
+    """Test suite for GithubOrgClient.fetch_many"""
+
+    def setUp(self):
+        """Start every test with an empty shared cache"""
+        GithubOrgClient.invalidate()
+
+    def test_pipelines_and_collects_errors(self):
+        """Test that repos start as orgs resolve and errors stay per org"""
+        fast_repos = threading.Event()
+
+        def org_payload(url):
+            name = url.rsplit("/", 1)[-1]
+            if name == "broken":
+                raise ValueError("no such org")
+            if name == "slow":
+                # resolves only once the fast org moved on to its repos
+                self.assertTrue(fast_repos.wait(5))
+            return {"repos_url": url + "/repos"}
+
+        def repos_payload(url, per_page, concurrency):
+            if "fast" in url:
+                fast_repos.set()
+            return [{"name": url.split("/")[-2] + "-repo"}]
+
+        with patch('client.get_json', side_effect=org_payload), \
+                patch('client.get_json_paginated',
+                      side_effect=repos_payload) as mock_paginated:
+            results = list(GithubOrgClient.fetch_many(
+                ["slow", "fast", "broken"], concurrency=2, per_page=50,
+                page_concurrency=2))
+
+        self.assertEqual(results[0].name, "fast")
+        by_name = {result.name: result for result in results}
+        self.assertEqual(sorted(by_name), ["broken", "fast", "slow"])
+        self.assertEqual(by_name["slow"], OrgResult(
+            "slow", {"repos_url": "https://api.github.com/orgs/slow/repos"},
+            [{"name": "slow-repo"}]))
+        self.assertIsNone(by_name["broken"].org)
+        self.assertIsInstance(by_name["broken"].error, ValueError)
+        mock_paginated.assert_any_call(
+            "https://api.github.com/orgs/fast/repos", per_page=50,
+            concurrency=2)
+
+    def test_repos_error(self):
+        """Test that a failing repos fetch keeps the org payload"""
+        with patch('client.get_json', return_value=TEST_PAYLOAD[0][0]), \
+                patch('client.get_json_paginated',
+                      side_effect=ConnectionError("reset")) as mock_paginated:
+            result, = GithubOrgClient.fetch_many(["google"])
+
+        self.assertEqual(result.org, TEST_PAYLOAD[0][0])
+        self.assertIsNone(result.repos)
+        self.assertIsInstance(result.error, ConnectionError)
+        # the pages of each org are fetched one at a time by default
+        mock_paginated.assert_called_once_with(
+            TEST_PAYLOAD[0][0]["repos_url"], per_page=100, concurrency=1)
+
+
+class TestAsyncGithubOrgClient(unittest.IsolatedAsyncioTestCase):
+    """Test suite for the AsyncGithubOrgClient class"""
+
+    def setUp(self):
+        """Start every test with an empty shared cache"""
+        AsyncGithubOrgClient.invalidate()
+
+    @patch('client.async_get_json_paginated', return_value=TEST_PAYLOAD[0][1])
+    @patch('client.async_get_json', return_value=TEST_PAYLOAD[0][0])
+    async def test_public_repos(self, mock_get_json, mock_paginated):
+        """Test that concurrent clients share one org and repos fetch"""
+        clients = [AsyncGithubOrgClient("google") for _ in range(3)]
+        results = await asyncio.gather(
+            *(client.public_repos() for client in clients),
+            clients[0].public_repos(license="apache-2.0"))
+
+        self.assertEqual(results[0], [repo["name"]
+                                      for repo in TEST_PAYLOAD[0][1]])
+        self.assertEqual(results[0], results[2])
+        self.assertEqual(results[3], TEST_PAYLOAD[0][3])
+        mock_get_json.assert_awaited_once_with(
+            "https://api.github.com/orgs/google")
+        mock_paginated.assert_awaited_once_with(
+            TEST_PAYLOAD[0][0]["repos_url"], per_page=100, concurrency=8)
+
+    @patch('client.async_get_json_paginated', return_value=TEST_PAYLOAD[0][1])
+    @patch('client.async_get_json', return_value=TEST_PAYLOAD[0][0])
+    async def test_shared_settings(self, mock_get_json, mock_paginated):
+        """Test that settings of the common base reach both clients"""
+        class CompactClient(AsyncGithubOrgClient):
+            """Async client keeping compact repos"""
+            REPO_FIELDS = COMPACT_REPO_FIELDS
+
+        with patch.object(BaseGithubOrgClient, 'PER_PAGE', 50):
+            self.assertEqual(GithubOrgClient("google")._per_page, 50)
+            client = CompactClient("google")
+        repos = await client.repos_payload
+
+        self.assertNotIsInstance(repos[0], dict)
+        self.assertEqual(repos[0]["name"], TEST_PAYLOAD[0][1][0]["name"])
+        mock_paginated.assert_awaited_once_with(
+            TEST_PAYLOAD[0][0]["repos_url"], per_page=50, concurrency=8)
+        CompactClient.invalidate()
+
+
+class TestRepoFilter(unittest.TestCase):
+    """Test suite for compiled repo filters"""
+
+    def setUp(self):
+        """Serve the google fixture to a fresh client"""
+        GithubOrgClient.invalidate()
+        self.repos = TEST_PAYLOAD[0][1]
+        patcher = patch('client.get_json_paginated',
+                        return_value=self.repos)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch('client.GithubOrgClient._public_repos_url',
+                        new_callable=PropertyMock, return_value="url")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = GithubOrgClient("google")
+
+    @parameterized.expand([
+        ("fork", where(fork=True),
+         ["cpp-netlib", "dagger", "build-debian-cloud"]),
+        ("language_set", where(language={"C", "C++"}),
+         ["cpp-netlib", "ios-webkit-debug-proxy"]),
+        ("stars", where(min_stars=4000, max_stars=10000),
+         ["ios-webkit-debug-proxy", "traceur-compiler"]),
+        ("unlicensed", where(license=None), ["google.github.io"]),
+        ("and_not", where(license="apache-2.0") & ~where(fork=True),
+         ["kratu", "traceur-compiler", "firmata.py"]),
+        ("or", where(language="Dart") | where(license="bsl-1.0"),
+         ["episodes.dart", "cpp-netlib"]),
+        ("visibility", where(visibility="private", archived=False), []),
+    ])
+    def test_select(self, _, repo_filter, expected):
+        """Test that compiled filters select the expected repos"""
+        self.assertEqual(self.client.select(repo_filter), expected)
+
+    def test_select_many(self):
+        """Test that several filters are answered in one pass"""
+        result = self.client.select_many(
+            python=where(language="Python"),
+            popular=where(min_stars=5000))
+
+        self.assertEqual(result, {"python": ["firmata.py"],
+                                  "popular": ["dagger", "traceur-compiler"]})
+
+    def test_unknown_condition(self):
+        """Test that a misspelt condition is rejected"""
+        with self.assertRaises(TypeError):
+            where(stars=3)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -2,13 +2,37 @@
 """
 test suite for utils.py
 """
+import asyncio
+import gc
+import json
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+import weakref
+from types import MappingProxyType
 import unittest
+import requests
+from concurrent.futures import ThreadPoolExecutor
 from parameterized import parameterized
 from typing import Mapping, Sequence, Any
-from utils import access_nested_map
-from unittest.mock import patch, Mock
+from utils import access_nested_map, compile_path, project
+from utils import access_nested_map_many
+from unittest.mock import patch, AsyncMock, Mock, call
 from utils import get_json
-from utils import memoize
+from utils import get_json_paginated
+from utils import memoize, MemoRegistry
+from utils import RateLimiter, Transport
+from utils import CircuitBreaker, CircuitOpenError
+from utils import SingleFlight, result_flight
+from utils import ValidatorCache, validator_cache
+from utils import SQLiteCache, LRUCache
+from utils import async_get_json, async_get_json_paginated, async_memoize
+from utils import iter_json, iter_json_array
+from utils import JSON_DECODERS, decode_json
+from fixtures import TEST_PAYLOAD
+import utils
 
 
 class TestAccessNestedMap(unittest.TestCase):
@@ -35,10 +59,127 @@ class TestAccessNestedMap(unittest.TestCase):
             access_nested_map(nested_map, path)
 
 
+class TestCompilePath(unittest.TestCase):
+    """Test suite for the compile_path function"""
+
+    @parameterized.expand([
+        ({"a": 1}, ()),
+        ({"a": 1}, ("a",)),
+        ({"a": {"b": 2}}, ("a", "b")),
+        ({"a": {"b": {"c": 3}}}, ("a", "b", "c")),
+        ({"a": {"b": {"c": {"d": 4}}}}, ("a", "b", "c", "d")),
+        (MappingProxyType({"a": {"b": 2}}), ("a", "b")),
+        ({"a": MappingProxyType({"b": {"c": 3}})}, ("a", "b", "c")),
+        ({"a": 1}, ("b",)),
+        ({"a": 1}, ("a", "b")),
+        ({"a": None}, ("a", "b")),
+        ({"a": "xyz"}, ("a", 0)),
+        ({"a": [5]}, ("a", 0)),
+        ({"a": {"b": [5]}}, ("a", "b", 0)),
+        ({"a": {"b": {"c": 3}}}, ("a", "x", "c")),
+        ({"a": {"b": {"c": {"d": 4}}}}, ("a", "b", "c", "x")),
+    ])
+    def test_matches_access_nested_map(self, nested_map, path):
+        """Test that accessors return and raise like access_nested_map"""
+        try:
+            expected = access_nested_map(nested_map, path)
+        except KeyError as exc:
+            with self.assertRaises(KeyError) as raised:
+                compile_path(path)(nested_map)
+            self.assertEqual(raised.exception.args, exc.args)
+        else:
+            self.assertEqual(compile_path(path)(nested_map), expected)
+
+
+class TestAccessNestedMapMany(unittest.TestCase):
+    """Test suite for the access_nested_map_many function"""
+
+    paths = {"name": ["name"], "stars": ["stargazers_count"],
+             "license": ["license", "key"]}
+
+    def test_columns(self):
+        """Test that columns match per-map access_nested_map calls"""
+        repos = TEST_PAYLOAD[0][1]
+        columns = access_nested_map_many(repos, self.paths, default=None,
+                                         typecodes={"stars": "q"})
+
+        self.assertEqual(columns["name"], TEST_PAYLOAD[0][2])
+        self.assertEqual(columns["stars"].typecode, "q")
+        self.assertEqual(columns["stars"].tolist(),
+                         [repo["stargazers_count"] for repo in repos])
+        self.assertEqual(columns["license"][4], None)
+
+    def test_per_column_defaults(self):
+        """Test that defaults override default per column"""
+        columns = access_nested_map_many(
+            [{"name": "a"}], self.paths, default=None,
+            typecodes={"stars": "q"}, defaults={"stars": 0})
+
+        self.assertEqual(columns["stars"].tolist(), [0])
+        self.assertEqual(columns["license"], [None])
+
+    def test_missing_without_default(self):
+        """Test that a missing path raises without a default"""
+        with self.assertRaises(KeyError):
+            access_nested_map_many([{"name": "a"}], self.paths)
+
+    @unittest.skipUnless(utils.numpy, "numpy is not installed")
+    def test_numpy_columns(self):
+        """Test that typed columns convert to NumPy arrays"""
+        columns = access_nested_map_many(
+            TEST_PAYLOAD[0][1], {"stars": ["stargazers_count"]},
+            typecodes={"stars": "q"}, as_numpy=True)
+
+        self.assertEqual(int(columns["stars"].sum()), 27824)
+
+    @patch('utils.numpy', None)
+    def test_numpy_missing(self):
+        """Test that as_numpy needs numpy"""
+        with self.assertRaises(ImportError):
+            access_nested_map_many([], {}, as_numpy=True)
+
+
+class TestProject(unittest.TestCase):
+    """Test suite for the project function"""
+
+    def test_project(self):
+        """Test that records keep only the projected, present fields"""
+        maps = [
+            {"name": "a", "size": 1, "license": {"key": "mit", "x": 1}},
+            {"name": "b", "license": None},
+            {"name": "c", "license": {"key": "mit", "y": 2}},
+        ]
+
+        records = project(maps, ("name", "size", "license.key"))
+
+        self.assertEqual(records[0], {"name": "a", "size": 1,
+                                      "license": {"key": "mit"}})
+        self.assertEqual(dict(records[1]), {"name": "b", "license": None})
+        self.assertNotIn("size", records[1])
+        with self.assertRaises(KeyError):
+            records[1]["size"]
+        self.assertEqual(access_nested_map(records[2], ("license", "key")),
+                         "mit")
+        self.assertIs(records[0]["license"], records[2]["license"])
+        with self.assertRaises(AttributeError):
+            records[0].extra = 1
+
+    def test_equal_values_of_other_types_not_shared(self):
+        """Test that 1, True and 1.0 records stay distinct"""
+        records = project([{"a": 1}, {"a": True}, {"a": 1.0}, {"a": 1}],
+                          ["a"])
+        self.assertEqual([type(record["a"]) for record in records],
+                         [int, bool, float, int])
+        self.assertIs(records[0], records[3])
+
+        records = project([{"b": {"c": 1}}, {"b": {"c": True}}], ["b.c"])
+        self.assertIs(records[1]["b"]["c"], True)
+
+
 class TestGetJson(unittest.TestCase):
     """Test suite for the get_json function"""
 
-    @patch('utils.requests.get')
+    @patch('utils.transport.get')
     def test_get_json(self, mock_get):
         """Test that get_json returns the expected result"""
 
@@ -48,19 +189,963 @@ class TestGetJson(unittest.TestCase):
         ]
 
         for test_url, test_payload in test_cases:
-            mock_response = Mock()
-            mock_response.json.return_value = test_payload
+            mock_response = Mock(status_code=200, headers={},
+                                 content=json.dumps(test_payload).encode())
             mock_get.return_value = mock_response
 
             result = get_json(test_url)
 
-            mock_get.assert_called_once_with(test_url)
+            mock_get.assert_called_once_with(test_url, params=None,
+                                             headers={})
 
             self.assertEqual(result, test_payload)
 
             mock_get.reset_mock()
 
 
+class TestDecodeJson(unittest.TestCase):
+    """Test suite for the pluggable JSON decoders"""
+
+    @parameterized.expand([(name,) for name in JSON_DECODERS])
+    def test_decoders_agree(self, name):
+        """Test that every registered decoder reads the same bytes"""
+        data = json.dumps(TEST_PAYLOAD[0][1]).encode()
+        self.assertEqual(decode_json(data, name), TEST_PAYLOAD[0][1])
+
+    def test_default_and_callable(self):
+        """Test the global default and a per-call callable decoder"""
+        with patch('utils.json_decoder', "json"):
+            self.assertEqual(decode_json(b'{"a": [1]}'), {"a": [1]})
+        self.assertEqual(decode_json(b"[]", lambda data: data), b"[]")
+        with self.assertRaises(KeyError):
+            decode_json(b"[]", "missing")
+
+
+class TestCoalescing(unittest.TestCase):
+    """Test suite for single-flight requests in get_json"""
+
+    def test_single_flight_shares_outcome(self):
+        """Test that joined callers get the leader's result or error"""
+        flight = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+        results = []
+
+        def slow():
+            started.set()
+            release.wait(5)
+            return object()
+
+        def call():
+            results.append(flight.do("key", slow))
+        threads = [threading.Thread(target=call) for _ in range(4)]
+        threads[0].start()
+        started.wait(5)
+        for thread in threads[1:]:
+            thread.start()
+        while flight.stats()["shared"] < 3:
+            time.sleep(0.001)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(flight.stats(), {"calls": 1, "shared": 3,
+                                          "in_flight": 0})
+        self.assertEqual(len(results), 4)
+        self.assertTrue(all(result is results[0] for result in results))
+        with self.assertRaises(ZeroDivisionError):
+            flight.do("key", lambda: 1 / 0)
+
+    @patch('utils.transport.get')
+    def test_get_json_coalesces_concurrent_calls(self, mock_get):
+        """Test that concurrent get_json calls for a URL send one request"""
+        started = threading.Event()
+        release = threading.Event()
+
+        def respond(url, params=None, headers=None):
+            started.set()
+            release.wait(5)
+            return Mock(status_code=200, headers={}, links={},
+                        content=b'{"repos_url": "x"}')
+        mock_get.side_effect = respond
+        shared = result_flight.stats()["shared"]
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(
+            get_json("http://example.com/orgs/shared"))) for _ in range(8)]
+        threads[0].start()
+        started.wait(5)
+        for thread in threads[1:]:
+            thread.start()
+        while result_flight.stats()["shared"] < shared + 7:
+            time.sleep(0.001)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        mock_get.assert_called_once()
+        self.assertEqual(len(results), 8)
+        self.assertTrue(all(result is results[0] for result in results))
+
+
+class TestValidatorCache(unittest.TestCase):
+    """Test suite for conditional requests in get_json"""
+
+    def setUp(self):
+        """Start every test without cached validators"""
+        validator_cache.clear()
+
+    @patch('utils.transport.get')
+    def test_not_modified_serves_cached_body(self, mock_get):
+        """Test that a 304 returns the cached body without decoding"""
+        payload = {"repos_url": "http://example.com/repos"}
+        fresh = Mock(status_code=200, links={}, headers={
+            "ETag": '"abc"', "Last-Modified": "Mon, 01 Jan 2024"},
+            content=json.dumps(payload).encode())
+        not_modified = Mock(status_code=304, headers={})
+        mock_get.side_effect = [fresh, not_modified]
+        decoder = Mock(side_effect=json.loads)
+        before = validator_cache.stats()
+
+        first = get_json("http://example.com/org", decoder=decoder)
+        second = get_json("http://example.com/org", decoder=decoder)
+
+        self.assertIs(second, first)
+        decoder.assert_called_once_with(fresh.content)
+        mock_get.assert_called_with(
+            "http://example.com/org", params=None,
+            headers={"If-None-Match": '"abc"',
+                     "If-Modified-Since": "Mon, 01 Jan 2024"})
+        after = validator_cache.stats()
+        self.assertEqual((after["hits"] - before["hits"],
+                          after["misses"] - before["misses"]), (1, 0))
+
+    def test_evicts_least_recently_used(self):
+        """Test that the cache keeps at most maxsize validators"""
+        cache = ValidatorCache(maxsize=2)
+        response = Mock(headers={"ETag": '"x"'}, content=b'"x"')
+        for key in ("a", "b", "c"):
+            cache.store(key, response, key, {})
+
+        self.assertEqual(cache.headers("a"), {})
+        self.assertEqual(cache.lookup("c"), ("c", {}))
+
+    def test_bodies_bounded_by_bytes(self):
+        """Test that kept bodies are charged their content length"""
+        cache = ValidatorCache(max_bytes=100)
+        for key, size in (("a", 40), ("b", 40), ("c", 30), ("huge", 101)):
+            response = Mock(headers={"ETag": '"x"'}, content=b"x" * size)
+            cache.store(key, response, [key], {})
+
+        self.assertEqual(cache.headers("a"), {})
+        self.assertEqual(cache.headers("huge"), {})
+        self.assertEqual(cache.lookup("b"), (["b"], {}))
+        self.assertEqual(cache.stats()["bytes"], 70)
+
+
+class TestLRUCache(unittest.TestCase):
+    """Test suite for the byte-budgeted LRUCache"""
+
+    def test_evicts_by_bytes(self):
+        """Test that the budget evicts least recently used entries"""
+        cache = LRUCache(max_bytes=100, sizeof=len)
+        cache.set("a", "x" * 40)
+        cache.set("b", "y" * 40)
+        cache.get("a")
+        cache.set("c", "z" * 30)
+
+        self.assertEqual(cache.get("a"), "x" * 40)
+        with self.assertRaises(KeyError):
+            cache.get("b")
+        cache.set("huge", "h" * 101)
+        with self.assertRaises(KeyError):
+            cache.get("huge")
+        self.assertEqual(cache.stats(), {
+            "hits": 2, "misses": 2, "hit_rate": 0.5, "evictions": 1,
+            "oversized": 1, "entries": 2, "bytes": 70, "max_bytes": 100})
+
+    def test_peek_is_not_counted(self):
+        """Test that peek leaves counters and recency alone"""
+        cache = LRUCache(max_bytes=100, sizeof=len)
+        cache.set("a", "x" * 40)
+        cache.set("b", "y" * 40)
+        self.assertEqual(cache.peek("a"), "x" * 40)
+        with self.assertRaises(KeyError):
+            cache.peek("missing")
+        cache.set("c", "z" * 30)
+
+        with self.assertRaises(KeyError):
+            cache.peek("a")
+        self.assertEqual(cache.stats()["hits"], 0)
+        self.assertEqual(cache.stats()["misses"], 0)
+
+    def test_size_estimates(self):
+        """Test that sizes follow the payload and explicit sizes win"""
+        cache = LRUCache()
+        cache.set("small", TEST_PAYLOAD[0][0])
+        small = cache.stats()["bytes"]
+        cache.set("large", TEST_PAYLOAD[0][1])
+        self.assertGreater(cache.stats()["bytes"] - small, 10 * small)
+
+        cache.set("large", TEST_PAYLOAD[0][1], size=1234)
+        self.assertEqual(cache.stats()["bytes"], small + 1234)
+        cache.delete("small")
+        self.assertEqual(cache.stats()["bytes"], 1234)
+        compact = project(TEST_PAYLOAD[0][1], ("name", "license.key"))
+        self.assertLess(utils._deep_sizeof(compact),
+                        utils._deep_sizeof(TEST_PAYLOAD[0][1]))
+
+    def test_entries_expire(self):
+        """Test that an entry is a miss once its TTL has passed"""
+        cache = LRUCache(ttl=60)
+        with patch('utils.time.monotonic', return_value=100.0):
+            cache.set("a", 1)
+            cache.set("b", 2, ttl=600)
+        with patch('utils.time.monotonic', return_value=200.0):
+            with self.assertRaises(KeyError):
+                cache.get("a")
+            self.assertEqual(cache.get("b"), 2)
+        self.assertEqual(cache.stats()["entries"], 1)
+
+    def test_default_ttl_like_sqlite_cache(self):
+        """Test that entries expire by default, like SQLiteCache's"""
+        cache = LRUCache()
+        with patch('utils.time.monotonic', return_value=100.0):
+            cache.set("a", 1)
+        with patch('utils.time.monotonic', return_value=100.0 + 3599):
+            self.assertEqual(cache.get("a"), 1)
+        with patch('utils.time.monotonic', return_value=100.0 + 3600):
+            with self.assertRaises(KeyError):
+                cache.get("a")
+
+    @patch('utils.transport.get')
+    def test_get_json_reads_through(self, mock_get):
+        """Test that get_json serves repeated calls from the cache"""
+        mock_get.return_value = Mock(status_code=200, headers={}, links={},
+                                     content=b'{"login": "google"}')
+        cache = LRUCache()
+        with patch('utils.response_cache', cache):
+            first = get_json("http://example.com/orgs/google")
+            self.assertIs(get_json("http://example.com/orgs/google"), first)
+
+        mock_get.assert_called_once()
+        self.assertEqual(cache.stats()["hit_rate"], 0.5)
+
+
+def shared_fetch(path, log_path):
+    """Read one key through a per-process cache, logging computations"""
+    cache = SQLiteCache(path)
+
+    def compute():
+        with open(log_path, "a") as log:
+            log.write("{}\n".format(os.getpid()))
+        time.sleep(0.2)
+        return {"fetched_by": os.getpid()}
+    try:
+        return cache.get_or_set("http://example.com/orgs/google", compute)
+    finally:
+        cache.close()
+
+
+def async_shared_fetch(path, log_path):
+    """async_get_json one URL through a per-process cache, logging
+    requests
+    """
+    async def respond(url, params=None, headers=None):
+        with open(log_path, "a") as log:
+            log.write("{}\n".format(os.getpid()))
+        await asyncio.sleep(0.2)
+        return Mock(status_code=200, headers={}, links={},
+                    content=json.dumps({"fetched_by": os.getpid()}).encode())
+    cache = SQLiteCache(path)
+    try:
+        with patch('utils.response_cache', cache), \
+                patch('utils.async_transport.get', side_effect=respond):
+            return asyncio.run(async_get_json("http://example.com/async"))
+    finally:
+        cache.close()
+
+
+class TestSQLiteCache(unittest.TestCase):
+    """Test suite for the persistent SQLiteCache"""
+
+    def setUp(self):
+        """Give every test its own database file"""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "cache.db")
+
+    def tearDown(self):
+        """Remove the database file"""
+        self.tmpdir.cleanup()
+
+    def test_survives_reopen(self):
+        """Test that entries written by one cache are read by the next"""
+        cache = SQLiteCache(self.path)
+        cache.set("http://example.com", {"repos_url": "x"})
+        cache.close()
+
+        cache = SQLiteCache(self.path)
+        self.assertEqual(cache.get("http://example.com"),
+                         {"repos_url": "x"})
+        with self.assertRaises(KeyError):
+            cache.get("http://example.com/missing")
+        self.assertEqual(cache.stats()["hits"], 1)
+        self.assertEqual(cache.stats()["misses"], 1)
+        cache.close()
+
+    def test_entries_expire(self):
+        """Test that an entry is a miss once its TTL has passed"""
+        cache = SQLiteCache(self.path, ttl=60)
+        with patch('utils.time.time', return_value=1000.0):
+            cache.set("a", 1)
+            cache.set("b", 2, ttl=600)
+        with patch('utils.time.time', return_value=1100.0):
+            with self.assertRaises(KeyError):
+                cache.get("a")
+            self.assertEqual(cache.get("b"), 2)
+        cache.close()
+
+    def test_evicts_least_recently_used(self):
+        """Test that the byte budget evicts the least recently read key"""
+        cache = SQLiteCache(self.path, max_bytes=25)
+        with patch('utils.time.time', side_effect=range(1, 100)):
+            cache.set("a", "x" * 8)
+            cache.set("b", "y" * 8)
+            cache.get("a")
+            cache.set("c", "z" * 8)
+
+            self.assertEqual(cache.get("a"), "x" * 8)
+            with self.assertRaises(KeyError):
+                cache.get("b")
+        self.assertEqual(cache.stats()["evictions"], 1)
+        cache.close()
+
+    @patch('utils.transport.get')
+    def test_get_json_reads_through(self, mock_get):
+        """Test that get_json only reaches the network on a cache miss"""
+        response = Mock(status_code=200, headers={}, links={},
+                        content=b'{"login": "google"}')
+        mock_get.return_value = response
+        cache = SQLiteCache(self.path)
+
+        with patch('utils.response_cache', cache):
+            first = get_json("http://example.com/orgs/google")
+            second = get_json("http://example.com/orgs/google")
+
+        self.assertEqual(first, second)
+        mock_get.assert_called_once()
+        cache.close()
+
+    @patch('utils.transport.get')
+    def test_error_bodies_not_cached(self, mock_get):
+        """Test that a non-2xx body is returned but never stored"""
+        validator_cache.clear()
+        limited = Mock(status_code=403, headers={"ETag": '"e"'}, links={},
+                       content=b'{"message": "API rate limit exceeded"}')
+        ok = Mock(status_code=200, headers={}, links={},
+                  content=b'{"login": "google"}')
+        mock_get.side_effect = [limited, ok]
+        url = "http://example.com/orgs/limited"
+        cache = SQLiteCache(self.path)
+
+        with patch('utils.response_cache', cache):
+            self.assertEqual(get_json(url),
+                             {"message": "API rate limit exceeded"})
+            self.assertEqual(validator_cache.headers((url, ())), {})
+            self.assertEqual(get_json(url), {"login": "google"})
+        cache.close()
+        cache = SQLiteCache(self.path)
+        self.assertEqual(cache.get(url), {"login": "google"})
+        cache.close()
+
+    @unittest.skipUnless("fork" in multiprocessing.get_all_start_methods(),
+                         "needs fork")
+    def test_fetched_once_per_host(self):
+        """Test that concurrent processes compute a missing key once"""
+        log_path = os.path.join(self.tmpdir.name, "fetches.log")
+        SQLiteCache(self.path).close()
+        with multiprocessing.get_context("fork").Pool(4) as pool:
+            results = pool.starmap(shared_fetch,
+                                   [(self.path, log_path)] * 4)
+
+        with open(log_path) as log:
+            fetchers = log.read().split()
+        self.assertEqual(len(fetchers), 1)
+        self.assertEqual(results, [{"fetched_by": int(fetchers[0])}] * 4)
+
+    @unittest.skipUnless("fork" in multiprocessing.get_all_start_methods(),
+                         "needs fork")
+    def test_async_fetched_once_per_host(self):
+        """Test that async_get_json in many processes fetches once"""
+        log_path = os.path.join(self.tmpdir.name, "fetches.log")
+        SQLiteCache(self.path).close()
+        with multiprocessing.get_context("fork").Pool(4) as pool:
+            results = pool.starmap(async_shared_fetch,
+                                   [(self.path, log_path)] * 4)
+
+        with open(log_path) as log:
+            fetchers = log.read().split()
+        self.assertEqual(len(fetchers), 1)
+        self.assertEqual(results, [{"fetched_by": int(fetchers[0])}] * 4)
+
+    @unittest.skipUnless("fork" in multiprocessing.get_all_start_methods(),
+                         "needs fork")
+    def test_forked_child_reconnects(self):
+        """Test that a cache created before a fork works in the child"""
+        cache = SQLiteCache(self.path)
+        cache.set("parent", 1)
+
+        def child():
+            cache.set("child", cache.get("parent") + 1)
+        process = multiprocessing.get_context("fork").Process(target=child)
+        process.start()
+        process.join(10)
+
+        self.assertEqual(process.exitcode, 0)
+        self.assertEqual(cache.get("child"), 2)
+        cache.close()
+
+    def test_expired_lease_is_taken_over(self):
+        """Test that a lease left by a dead holder stops blocking others"""
+        holder = SQLiteCache(self.path, lease_timeout=0.1)
+        self.assertTrue(holder._lease("key"))
+        waiter = SQLiteCache(self.path, lease_timeout=0.1)
+        self.assertFalse(waiter._lease("key"))
+
+        self.assertEqual(waiter.get_or_set("key", lambda: "mine"), "mine")
+        self.assertGreater(waiter.stats()["lease_waits"], 0)
+        self.assertEqual(holder.get("key"), "mine")
+        holder.close()
+        waiter.close()
+
+
+class TestIterJson(unittest.TestCase):
+    """Test suite for streaming JSON decoding"""
+
+    @parameterized.expand([(1,), (3,), (64,), (1 << 20,)])
+    def test_iter_json_array_chunks(self, size):
+        """Test that items decode identically however the body is split"""
+        items = [1, -3.5e2, "a,]\u00e9[", {"x": [1, 2]}, None, True,
+                 {"name": "repo", "license": {"key": "mit"}}]
+        data = json.dumps(items, ensure_ascii=False).encode()
+        chunks = (data[i:i + size] for i in range(0, len(data), size))
+
+        self.assertEqual(list(iter_json_array(chunks)), items)
+
+    @parameterized.expand([(b"[1, 2",), (b"[1 2]",), (b"{}",), (b"[1,]",)])
+    def test_iter_json_array_invalid(self, data):
+        """Test that malformed or truncated arrays raise"""
+        with self.assertRaises(ValueError):
+            list(iter_json_array([data]))
+
+    @patch('utils.transport.get')
+    def test_iter_json_streams_pages(self, mock_get):
+        """Test that items are yielded page by page before the next GET"""
+        first = Mock(links={"next": {"url": "http://example.com/r?page=2"}})
+        first.iter_content.return_value = [b'[{"name": ', b'"a"}]']
+        second = Mock(links={})
+        second.iter_content.return_value = [b'[{"name": "b"}]']
+        mock_get.side_effect = [first, second]
+
+        items = iter_json("http://example.com/r", per_page=1)
+
+        self.assertEqual(next(items), {"name": "a"})
+        self.assertEqual(mock_get.call_count, 1)
+        self.assertEqual(list(items), [{"name": "b"}])
+        mock_get.assert_called_with("http://example.com/r?page=2",
+                                    params=None, stream=True)
+        first.close.assert_called_once()
+        second.close.assert_called_once()
+
+
+class TestTransport(unittest.TestCase):
+    """Test suite for the pooled Transport"""
+
+    def test_session_is_shared(self):
+        """Test that one pooled session serves every call and thread"""
+        transport = Transport(pool_maxsize=4)
+        sessions = []
+        threads = [threading.Thread(
+            target=lambda: sessions.append(transport.session))
+            for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(set(map(id, sessions))), 1)
+        adapter = sessions[0].get_adapter("https://api.github.com")
+        self.assertEqual(adapter._pool_maxsize, 4)
+
+    def test_get_uses_session(self):
+        """Test that get goes through the session and close resets it"""
+        transport = Transport()
+        with patch.object(transport, '_new_session') as mock_new:
+            mock_new.return_value.get.return_value = Mock(status_code=200,
+                                                          headers={})
+            transport.get("http://example.com", params=None)
+            transport.close()
+            transport.get("http://example.com")
+
+        self.assertEqual(mock_new.call_count, 2)
+        mock_new.return_value.get.assert_called_with(
+            "http://example.com", timeout=transport.timeout)
+        mock_new.return_value.close.assert_called_once()
+
+
+class FakeClock:
+    """Monotonic and wall clocks advanced only by sleeping"""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = []
+
+    def sleep(self, seconds):
+        """Record and advance"""
+        self.slept.append(seconds)
+        self.now += seconds
+
+    def patch(self, test):
+        """Install the clock into utils.time for the test"""
+        for name, value in (("monotonic", lambda: self.now),
+                            ("time", lambda: self.now),
+                            ("sleep", self.sleep)):
+            patcher = patch('utils.time.' + name, side_effect=value)
+            patcher.start()
+            test.addCleanup(patcher.stop)
+        return self
+
+
+def rate_limited(status, remaining, reset, retry_after=None):
+    """A response carrying GitHub rate limit headers"""
+    headers = {"X-RateLimit-Remaining": str(remaining),
+               "X-RateLimit-Reset": str(reset)}
+    if retry_after is not None:
+        headers["Retry-After"] = str(retry_after)
+    return Mock(status_code=status, headers=headers)
+
+
+class TestRateLimiter(unittest.TestCase):
+    """Test suite for the token bucket RateLimiter"""
+
+    def setUp(self):
+        """Run on a fake clock"""
+        self.clock = FakeClock().patch(self)
+
+    def test_paces_remaining_quota_until_reset(self):
+        """Test that calls are spread over the time left to the reset"""
+        limiter = RateLimiter(burst=2)
+        limiter.acquire()
+        self.assertFalse(limiter.update(
+            rate_limited(200, 10, self.clock.now + 100)))
+
+        for _ in range(3):
+            limiter.acquire()
+
+        self.assertEqual(limiter.remaining, 10)
+        self.assertAlmostEqual(limiter.rate, 0.1)
+        self.assertEqual(len(self.clock.slept), 1)
+        self.assertAlmostEqual(self.clock.slept[0], 10)
+
+    def test_rejection_blocks_until_retry_after(self):
+        """Test that a rejected call holds every caller back"""
+        limiter = RateLimiter()
+        self.assertTrue(limiter.update(
+            rate_limited(429, 5, self.clock.now + 100, retry_after=30)))
+        limiter.acquire()
+
+        self.assertEqual(self.clock.slept, [30])
+        self.assertEqual(limiter.rejections, 1)
+
+    def test_transport_queues_rejected_requests(self):
+        """Test that Transport.get waits out an exhausted quota"""
+        transport = Transport()
+        session = Mock()
+        session.get.side_effect = [
+            rate_limited(403, 0, self.clock.now + 60),
+            rate_limited(200, 4999, self.clock.now + 3600),
+        ]
+        transport._session = session
+
+        response = transport.get("http://example.com")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(session.get.call_count, 2)
+        self.assertEqual(self.clock.slept, [60])
+
+
+class TestResilience(unittest.TestCase):
+    """Test suite for timeouts, retries and circuit breaking"""
+
+    def setUp(self):
+        """Run on a fake clock with a mocked session"""
+        self.clock = FakeClock().patch(self)
+        self.transport = Transport(retries=2, backoff=1, failure_threshold=3,
+                                   reset_timeout=60)
+        self.session = Mock()
+        self.transport._session = self.session
+
+    def test_retries_connection_errors(self):
+        """Test that failures are retried with bounded, jittered backoff"""
+        ok = Mock(status_code=200, headers={})
+        self.session.get.side_effect = [requests.ConnectionError(),
+                                        requests.ReadTimeout(), ok]
+
+        with patch('utils.random.uniform', side_effect=lambda a, b: b):
+            response = self.transport.get("http://example.com",
+                                          timeout=(1, 2))
+
+        self.assertIs(response, ok)
+        self.session.get.assert_called_with("http://example.com",
+                                            timeout=(1, 2))
+        self.assertEqual(self.clock.slept, [1, 2])
+        self.assertEqual(self.transport.stats(), {
+            "requests": 3, "retries": 2, "connection_errors": 1,
+            "timeouts": 1})
+
+    def test_gives_up_after_retries(self):
+        """Test that the last 5xx is returned and the last error raised"""
+        self.session.get.return_value = Mock(status_code=502, headers={})
+        self.assertEqual(self.transport.get("http://a.com").status_code, 502)
+
+        self.session.get.side_effect = requests.ConnectTimeout()
+        with self.assertRaises(requests.ConnectTimeout):
+            self.transport.get("http://b.com")
+        self.assertEqual(self.session.get.call_count, 6)
+
+    def test_circuit_breaker(self):
+        """Test that an unhealthy host is short-circuited until it heals"""
+        self.session.get.side_effect = requests.ConnectionError()
+        with self.assertRaises(requests.ConnectionError) as raised:
+            self.transport.get("http://example.com/a")
+        self.assertNotIsInstance(raised.exception, CircuitOpenError)
+        with self.assertRaises(CircuitOpenError):
+            self.transport.get("http://example.com/b")
+        self.assertEqual(self.session.get.call_count, 3)
+        self.assertEqual(self.transport.breaker("http://example.com").state,
+                         CircuitBreaker.OPEN)
+
+        self.clock.now += 61
+        self.session.get.side_effect = None
+        self.session.get.return_value = Mock(status_code=200, headers={})
+        self.transport.get("http://example.com/c")
+        self.assertEqual(self.transport.breaker("http://example.com").state,
+                         CircuitBreaker.CLOSED)
+        self.assertEqual(self.transport.stats()["short_circuits"], 1)
+
+    def test_half_open_trial_other_errors(self):
+        """Test that a trial failing with any exception reopens the circuit
+        """
+        breaker = self.transport.breaker("http://example.com")
+        for _ in range(3):
+            breaker.record_failure()
+        self.clock.now += 61
+        self.session.get.side_effect = \
+            requests.exceptions.ChunkedEncodingError()
+        with self.assertRaises(requests.exceptions.ChunkedEncodingError):
+            self.transport.get("http://example.com/a")
+        self.assertEqual(self.session.get.call_count, 1)
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+        self.clock.now += 61
+        self.session.get.side_effect = None
+        self.session.get.return_value = Mock(status_code=200, headers={})
+        self.transport.get("http://example.com/b")
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_caller_errors_do_not_count(self):
+        """Test that caller side errors never open a healthy circuit and
+        only hand a half-open trial to the next call
+        """
+        breaker = self.transport.breaker("http://example.com")
+        self.session.get.side_effect = TypeError("bad keyword")
+        for _ in range(5):
+            with self.assertRaises(TypeError):
+                self.transport.get("http://example.com/a")
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        self.assertEqual(breaker.failures, 0)
+
+        for _ in range(3):
+            breaker.record_failure()
+        self.clock.now += 61
+        with self.assertRaises(TypeError):
+            self.transport.get("http://example.com/a")
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.session.get.side_effect = None
+        self.session.get.return_value = Mock(status_code=200, headers={})
+        self.transport.get("http://example.com/b")
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+
+@unittest.skipIf(utils.aiohttp is None, "needs aiohttp")
+class TestAsyncResilience(unittest.IsolatedAsyncioTestCase):
+    """Test suite for circuit breaking in AsyncTransport"""
+
+    async def test_cancelled_trial_reopens(self):
+        """Test that cancelling a half-open trial reopens the circuit"""
+        async_transport = utils.AsyncTransport(
+            Transport(failure_threshold=1, reset_timeout=0))
+        breaker = async_transport._base().breaker("http://example.com")
+        breaker.record_failure()
+        started = asyncio.Event()
+
+        async def hang(*args):
+            started.set()
+            await asyncio.Event().wait()
+        with patch.object(async_transport, '_send', side_effect=hang):
+            trial = asyncio.ensure_future(
+                async_transport.get("http://example.com/a"))
+            await started.wait()
+            self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+            trial.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await trial
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        # the next call is let through as the new trial
+        self.assertTrue(breaker.allow())
+
+    async def test_cancelled_calls_keep_circuit_closed(self):
+        """Test that cancelled requests are not host failures"""
+        async_transport = utils.AsyncTransport(
+            Transport(failure_threshold=5))
+        breaker = async_transport._base().breaker("http://example.com")
+
+        async def hang(*args):
+            await asyncio.Event().wait()
+        with patch.object(async_transport, '_send', side_effect=hang):
+            for _ in range(5):
+                with self.assertRaises(asyncio.TimeoutError):
+                    await asyncio.wait_for(
+                        async_transport.get("http://example.com/a"), 0.01)
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        self.assertEqual(breaker.failures, 0)
+
+
+class TestGetJsonPaginated(unittest.TestCase):
+    """Test suite for the get_json_paginated function"""
+
+    @patch('utils.transport.get')
+    def test_not_confused_with_get_json(self, mock_get):
+        """Test that a cached first page is not taken for every page"""
+        url = "http://example.com/r"
+        next_url = "http://example.com/r?page=2"
+
+        def respond(page_url, params=None, headers=None):
+            if page_url == next_url:
+                return Mock(status_code=200, headers={}, links={},
+                            content=b"[3]")
+            return Mock(status_code=200, headers={},
+                        links={"next": {"url": next_url}},
+                        content=b"[1, 2]")
+        mock_get.side_effect = respond
+
+        with patch('utils.response_cache', LRUCache()):
+            self.assertEqual(get_json(url), [1, 2])
+            self.assertEqual(get_json_paginated(url), [1, 2, 3])
+            self.assertEqual(get_json(url), [1, 2])
+
+    @patch('utils.transport.get')
+    def test_follows_next_links(self, mock_get):
+        """Test that every page is fetched and concatenated in order"""
+        pages = [
+            ([{"name": "a"}, {"name": "b"}],
+             {"next": {"url": "http://example.com/r?per_page=2&page=2"}}),
+            ([{"name": "c"}], {}),
+        ]
+        responses = []
+        for payload, links in pages:
+            response = Mock(links=links, status_code=200, headers={},
+                            content=json.dumps(payload).encode())
+            responses.append(response)
+        mock_get.side_effect = responses
+
+        result = get_json_paginated("http://example.com/r", per_page=2)
+
+        self.assertEqual(result, [{"name": "a"}, {"name": "b"},
+                                  {"name": "c"}])
+        mock_get.assert_has_calls([
+            call("http://example.com/r", params={"per_page": 2},
+                 headers={}),
+            call("http://example.com/r?per_page=2&page=2", params=None,
+                 headers={}),
+        ], any_order=False)
+
+    @parameterized.expand([(1,), (4,)])
+    @patch('utils.transport.get')
+    def test_prefetches_up_to_last_page(self, concurrency, mock_get):
+        """Test that pages 2..N are fetched and reassembled in order"""
+        base = "http://example.com/r?per_page=1&page={}"
+
+        def respond(url, params=None, headers=None):
+            page = int(url.rsplit("=", 1)[1]) if "page=" in url else 1
+            links = {"last": {"url": base.format(5)}}
+            if page < 5:
+                links["next"] = {"url": base.format(page + 1)}
+            response = Mock(links=links, status_code=200, headers={},
+                            content=json.dumps([page]).encode())
+            return response
+        mock_get.side_effect = respond
+
+        result = get_json_paginated("http://example.com/r", per_page=1,
+                                    concurrency=concurrency)
+
+        self.assertEqual(result, [1, 2, 3, 4, 5])
+        self.assertEqual(mock_get.call_count, 5)
+
+
+class TestAsyncGetJson(unittest.IsolatedAsyncioTestCase):
+    """Test suite for the asyncio get_json functions"""
+
+    def setUp(self):
+        """Start from an empty validator cache"""
+        validator_cache.clear()
+
+    @patch('utils.async_transport.get', new_callable=AsyncMock)
+    async def test_async_get_json_coalesces(self, mock_get):
+        """Test that concurrent awaiters of one URL share a request"""
+        mock_get.return_value = Mock(status_code=200, headers={}, links={},
+                                     content=b'{"payload": true}')
+        results = await asyncio.gather(*(
+            async_get_json("http://example.com/async") for _ in range(5)))
+
+        mock_get.assert_awaited_once_with(
+            "http://example.com/async", params=None, headers={})
+        self.assertEqual(results, [{"payload": True}] * 5)
+        self.assertTrue(all(result is results[0] for result in results))
+
+    @patch('utils.async_transport.get', new_callable=AsyncMock)
+    async def test_async_get_json_paginated(self, mock_get):
+        """Test that the remaining pages are awaited together, in order"""
+        url = "https://api.github.com/orgs/google/repos"
+        pages = {
+            "{}?per_page=2&page=2".format(url): [3, 4],
+            "{}?per_page=2&page=3".format(url): [5],
+        }
+        last = '{}?per_page=2&page=3'.format(url)
+
+        async def respond(page_url, params=None, headers=None):
+            await asyncio.sleep(0)
+            if params:
+                return Mock(status_code=200, headers={},
+                            links={"last": {"url": last}},
+                            content=b"[1, 2]")
+            return Mock(status_code=200, headers={}, links={},
+                        content=json.dumps(pages[page_url]).encode())
+        mock_get.side_effect = respond
+
+        self.assertEqual(await async_get_json_paginated(url, per_page=2),
+                         [1, 2, 3, 4, 5])
+        self.assertEqual(mock_get.await_count, 3)
+
+    @patch('utils.transport.get')
+    async def test_cached_fallback_more_keys_than_threads(self, mock_get):
+        """Test that cache misses waiting on fetches cannot starve the
+        threads the fetches run on
+        """
+        def respond(url, params=None, headers=None):
+            time.sleep(0.01)
+            return Mock(status_code=200, headers={}, links={},
+                        content=json.dumps(url).encode())
+        mock_get.side_effect = respond
+        loop = asyncio.get_running_loop()
+        loop.set_default_executor(ThreadPoolExecutor(2))
+        urls = ["http://example.com/many/{}".format(i) for i in range(8)]
+        with patch('utils.aiohttp', None), \
+                patch('utils.response_cache', LRUCache()), \
+                patch('utils._cache_executor', ThreadPoolExecutor(4)):
+            results = await asyncio.wait_for(asyncio.gather(
+                *map(async_get_json, urls)), 5)
+
+        self.assertEqual(results, urls)
+
+    @patch('utils.transport.get')
+    async def test_thread_fallback(self, mock_get):
+        """Test that without aiohttp the blocking transport is used"""
+        mock_get.return_value = Mock(status_code=200, headers={}, links={},
+                                     content=b'{"payload": 1}')
+        with patch('utils.aiohttp', None):
+            result = await async_get_json("http://example.com/fallback")
+
+        self.assertEqual(result, {"payload": 1})
+        mock_get.assert_called_once_with(
+            "http://example.com/fallback", params=None, headers={})
+
+
+class TestAsyncMemoize(unittest.IsolatedAsyncioTestCase):
+    """Test suite for the async_memoize decorator"""
+
+    async def test_shares_one_task(self):
+        """Test that concurrent awaiters share one call and its result"""
+        calls = []
+
+        class TestClass:
+            """Class to test the async_memoize decorator"""
+
+            @async_memoize
+            async def a_property(self):
+                """A coroutine decorated with async_memoize"""
+                calls.append(self)
+                await asyncio.sleep(0)
+                return object()
+
+        instance = TestClass()
+        results = await asyncio.gather(*(instance.a_property
+                                         for _ in range(4)))
+        self.assertTrue(all(result is results[0] for result in results))
+        self.assertIs(await instance.a_property, results[0])
+        self.assertEqual(calls, [instance])
+
+        refreshed = await TestClass.a_property.refresh(instance)
+        self.assertIsNot(refreshed, results[0])
+        self.assertIs(await instance.a_property, refreshed)
+
+    async def test_errors_not_cached(self):
+        """Test that an exception reaches every awaiter and is not stored"""
+        outcomes = [ValueError("first"), 42]
+
+        class TestClass:
+            """Class to test the async_memoize decorator"""
+
+            @async_memoize(key=lambda self: "shared",
+                           registry=MemoRegistry())
+            async def a_property(self):
+                """A coroutine failing on its first call"""
+                await asyncio.sleep(0)
+                outcome = outcomes.pop(0)
+                if isinstance(outcome, Exception):
+                    raise outcome
+                return outcome
+
+        results = await asyncio.gather(
+            TestClass().a_property, TestClass().a_property,
+            return_exceptions=True)
+        self.assertIsInstance(results[0], ValueError)
+        self.assertIs(results[1], results[0])
+        self.assertEqual(await TestClass().a_property, 42)
+        self.assertEqual(await TestClass().a_property, 42)
+
+    async def test_stale_while_revalidate(self):
+        """Test that a stale value is returned while a task refreshes it"""
+        counter = iter(range(100))
+
+        class TestClass:
+            """Class to test the async_memoize decorator"""
+
+            @async_memoize(ttl=60, refresh_after=10)
+            async def a_property(self):
+                """Next number"""
+                await asyncio.sleep(0)
+                return next(counter)
+
+        instance = TestClass()
+        with patch('utils.time.monotonic', return_value=100.0):
+            self.assertEqual(await instance.a_property, 0)
+        with patch('utils.time.monotonic', return_value=111.0):
+            self.assertEqual(await instance.a_property, 0)
+            self.assertEqual(await instance.a_property, 0)
+            await asyncio.gather(*TestClass.a_property._tasks)
+            self.assertEqual(await instance.a_property, 1)
+
+
 class TestMemoize(unittest.TestCase):
     """Test suite for the memoize decorator"""
 
@@ -94,6 +1179,264 @@ class TestMemoize(unittest.TestCase):
             # Ensure the method is called only once
             mock_method.assert_called_once()
 
+    def test_memoize_shared_key(self):
+        """Test that instances with the same key share one result"""
+        registry = MemoRegistry(maxsize=2)
+        calls = []
+
+        class Org:
+            """Class memoizing by name in a private registry"""
+
+            def __init__(self, name):
+                self.name = name
+
+            @memoize(key=lambda self: self.name, registry=registry)
+            def payload(self):
+                """Record the computation"""
+                calls.append(self.name)
+                return {"login": self.name}
+
+        self.assertEqual(Org("a").payload, {"login": "a"})
+        self.assertEqual(Org("a").payload, {"login": "a"})
+        self.assertEqual(calls, ["a"])
+
+        self.assertEqual(registry.invalidate(Org, key="a"), 1)
+        Org("a").payload
+        Org("b").payload
+        Org("c").payload
+        self.assertEqual(calls, ["a", "a", "b", "c"])
+        self.assertEqual(len(registry), 2)
+
+    def test_registry_bounded_by_bytes(self):
+        """Test that shared values are evicted by their size"""
+        registry = MemoRegistry(max_bytes=20000)
+
+        class Org:
+            """Class memoizing a large payload by name"""
+
+            def __init__(self, name):
+                self.name = name
+
+            @memoize(key=lambda self: self.name, registry=registry)
+            def payload(self):
+                """A payload of about 9 KB"""
+                return ["x" * 8000]
+
+        Org("a").payload
+        Org("b").payload
+        self.assertEqual(len(registry), 2)
+        Org("c").payload
+        self.assertEqual(len(registry), 2)
+        self.assertLessEqual(registry.stats()["bytes"], 20000)
+        self.assertEqual(registry.stats()["evictions"], 1)
+
+    def test_dependents_do_not_keep_payload_alive(self):
+        """Test that a derived value does not hold on to its source"""
+
+        class Payload(list):
+            """List that can be weakly referenced"""
+
+        class Org:
+            """Class with a payload and a value derived from it"""
+
+            def __init__(self):
+                self.version = 0
+
+            @memoize
+            def payload(self):
+                """A new payload for each version"""
+                return Payload([self.version])
+
+            @memoize(depends_on="payload")
+            def first(self):
+                """Derived from the payload"""
+                return self.payload[0]
+
+        org = Org()
+        self.assertEqual(org.first, 0)
+        old = weakref.ref(org.payload)
+        org.version = 1
+        Org.payload.refresh(org)
+        gc.collect()
+        self.assertIsNone(old())
+        self.assertEqual(org.first, 1)
+
+    def test_unchanged_payload_keeps_dependents(self):
+        """Test that refreshing to an equal payload reuses derived values"""
+        calls = []
+
+        class Org:
+            """Class with a payload and a value derived from it"""
+
+            @memoize
+            def payload(self):
+                """Always the same payload"""
+                return [1, 2]
+
+            @memoize(depends_on="payload")
+            def total(self):
+                """Derived from the payload"""
+                calls.append(1)
+                return sum(self.payload)
+
+        org = Org()
+        self.assertEqual(org.total, 3)
+        Org.payload.refresh(org)
+        self.assertEqual(org.total, 3)
+        self.assertEqual(calls, [1])
+
+    def test_memoize_single_flight(self):
+        """Test that concurrent first accesses compute only once"""
+        calls = []
+        started = threading.Event()
+        release = threading.Event()
+
+        class Slow:
+            """Class whose memoized property blocks until released"""
+
+            @memoize
+            def value(self):
+                """Record the computation and wait"""
+                calls.append(1)
+                started.set()
+                release.wait(5)
+                return 42
+
+        instance = Slow()
+        results = []
+        threads = [threading.Thread(
+            target=lambda: results.append(instance.value))
+            for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        started.wait(5)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, [42] * 8)
+        self.assertEqual(len(calls), 1)
+
+    def test_memoize_ttl_invalidate_refresh(self):
+        """Test TTL expiry and the invalidate/refresh hooks"""
+        counter = iter(range(100))
+
+        class Counter:
+            """Class returning a new number on every computation"""
+
+            @memoize(ttl=10)
+            def value(self):
+                """Next number"""
+                return next(counter)
+
+        instance = Counter()
+        with patch('utils.time.monotonic', return_value=100.0):
+            self.assertEqual(instance.value, 0)
+        with patch('utils.time.monotonic', return_value=105.0):
+            self.assertEqual(instance.value, 0)
+        with patch('utils.time.monotonic', return_value=111.0):
+            self.assertEqual(instance.value, 1)
+            Counter.value.invalidate(instance)
+            self.assertEqual(instance.value, 2)
+            self.assertEqual(Counter.value.refresh(instance), 3)
+            self.assertEqual(instance.value, 3)
+
+    def test_memoize_stale_while_revalidate(self):
+        """Test that stale values are served while refreshing in the
+        background, and that callers only wait past the TTL
+        """
+        outcomes = [0, RuntimeError("refresh failed"), 1, 2]
+        release = threading.Event()
+
+        class Counter:
+            """Class returning the next outcome on every computation"""
+            REFRESH_AFTER = 10
+
+            @memoize(ttl=60, refresh_after="REFRESH_AFTER")
+            def value(self):
+                """Next outcome, the refreshes once released"""
+                outcome = outcomes.pop(0)
+                if outcome:
+                    release.wait(5)
+                if isinstance(outcome, Exception):
+                    raise outcome
+                return outcome
+
+        def settle():
+            """Wait for the background refresh to finish"""
+            while Counter.value._revalidating:
+                time.sleep(0.001)
+
+        instance = Counter()
+        with patch('utils.time.monotonic', return_value=100.0):
+            self.assertEqual(instance.value, 0)
+        with patch('utils.time.monotonic', return_value=111.0):
+            # failing refresh: the stale value stays
+            self.assertEqual(instance.value, 0)
+            release.set()
+            settle()
+            self.assertEqual(instance.value, 0)
+            settle()
+            self.assertEqual(instance.value, 1)
+            self.assertEqual(outcomes, [2])
+        with patch('utils.time.monotonic', return_value=171.0):
+            self.assertEqual(instance.value, 2)
+
+    def test_memoize_depends_on(self):
+        """Test that a derived value follows the object it depends on"""
+
+        class Derived:
+            """Class deriving a length from a replaceable payload"""
+
+            def __init__(self):
+                self.payload = [1, 2]
+
+            @memoize(depends_on="payload")
+            def size(self):
+                """Length of the payload"""
+                return len(self.payload)
+
+        instance = Derived()
+        self.assertEqual(instance.size, 2)
+        instance.payload.append(3)
+        self.assertEqual(instance.size, 2)
+        instance.payload = [1]
+        self.assertEqual(instance.size, 1)
+
+    @parameterized.expand([
+        (("_value",),),
+        (("__weakref__",),),
+    ])
+    def test_memoize_slots(self, slots):
+        """Test that memoize works on classes using __slots__"""
+
+        class Slotted:
+            """Class without an instance __dict__"""
+            __slots__ = slots
+
+            @memoize
+            def value(self):
+                """A simple value"""
+                return object()
+
+        instance = Slotted()
+        self.assertIs(instance.value, instance.value)
+
+    def test_memoize_slots_without_storage(self):
+        """Test that a class with no usable storage gets a clear error"""
+
+        class Sealed:
+            """Class with neither the slot nor weak references"""
+            __slots__ = ()
+
+            @memoize
+            def value(self):
+                """A simple value"""
+                return 42
+
+        with self.assertRaises(TypeError):
+            Sealed().value
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -1,20 +1,91 @@
 #!/usr/bin/env python3
 """Generic utilities for github org client.
 """
+import asyncio
+import codecs
+import contextvars
+import json
+import os
+import random
+import re
 import requests
-from functools import wraps
+import sqlite3
+import sys
+import threading
+import time
+import weakref
+from array import array
+from collections import Counter, OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import update_wrapper
+from urllib.parse import parse_qs, urlencode, urlsplit, urlunsplit
 from typing import (
     Mapping,
     Sequence,
     Any,
+    Awaitable,
     Dict,
     Callable,
+    List,
+    Tuple,
+    Hashable,
+    Iterable,
+    Iterator,
 )
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
 __all__ = [
+    "JSON_DECODERS",
+    "LRUCache",
+    "AsyncResponse",
+    "AsyncSingleFlight",
+    "AsyncTransport",
+    "CompactRecord",
+    "CircuitBreaker",
+    "CircuitOpenError",
+    "MemoRegistry",
+    "RateLimiter",
+    "SQLiteCache",
+    "SingleFlight",
+    "Transport",
+    "ValidatorCache",
     "access_nested_map",
+    "access_nested_map_many",
+    "async_get_json",
+    "async_get_json_paginated",
+    "async_memoize",
+    "async_request_flight",
+    "async_result_flight",
+    "async_transport",
+    "compile_path",
+    "decode_json",
     "get_json",
+    "get_json_paginated",
+    "iter_json",
+    "iter_json_array",
+    "json_decoder",
+    "memo_registry",
     "memoize",
+    "project",
+    "request_flight",
+    "response_cache",
+    "result_flight",
+    "transport",
+    "validator_cache",
 ]
 
 
@@ -40,15 +111,1613 @@ def access_nested_map(nested_map: Mapping, path: Sequence) -> Any:
     return nested_map
 
 
-def get_json(url: str) -> Dict:
+def compile_path(path: Sequence) -> Callable[[Mapping], Any]:
+    """Compile a key path into a reusable accessor.
+    ``compile_path(path)(nested_map)`` returns and raises exactly what
+    ``access_nested_map(nested_map, path)`` does, but walks plain dicts
+    with direct lookups unrolled for paths of up to three keys, and only
+    falls back to the generic Mapping walk for anything else.
+    Example
+    -------
+    >>> license_key = compile_path(("license", "key"))
+    >>> license_key({"license": {"key": "mit"}})
+    'mit'
+    """
+    path = tuple(path)
+    if not path:
+        return lambda nested_map: access_nested_map(nested_map, path)
+    first, rest = path[0], path[1:]
+
+    if len(path) == 1:
+        def access(nested_map: Mapping) -> Any:
+            """Value at the compiled path"""
+            if type(nested_map) is dict:
+                return nested_map[first]
+            return access_nested_map(nested_map, path)
+    elif len(path) == 2:
+        second = path[1]
+
+        def access(nested_map: Mapping) -> Any:
+            """Value at the compiled path"""
+            if type(nested_map) is not dict:
+                return access_nested_map(nested_map, path)
+            value = nested_map[first]
+            if type(value) is dict:
+                return value[second]
+            return access_nested_map(value, rest)
+    elif len(path) == 3:
+        second, third = path[1:]
+
+        def access(nested_map: Mapping) -> Any:
+            """Value at the compiled path"""
+            if type(nested_map) is not dict:
+                return access_nested_map(nested_map, path)
+            value = nested_map[first]
+            if type(value) is not dict:
+                return access_nested_map(value, rest)
+            value = value[second]
+            if type(value) is dict:
+                return value[third]
+            return access_nested_map(value, path[2:])
+    else:
+        def access(nested_map: Mapping) -> Any:
+            """Value at the compiled path"""
+            for depth, key in enumerate(path):
+                if type(nested_map) is not dict:
+                    return access_nested_map(nested_map, path[depth:])
+                nested_map = nested_map[key]
+            return nested_map
+    return access
+
+
+_ABSENT = object()
+
+
+def access_nested_map_many(maps: Iterable[Mapping],
+                           paths: Mapping[str, Sequence],
+                           default: Any = _ABSENT,
+                           typecodes: Mapping[str, str] = None,
+                           as_numpy: bool = False,
+                           defaults: Mapping[str, Any] = None
+                           ) -> Dict[str, Any]:
+    """Access several key paths of many nested maps in one pass.
+    Parameters
+    ----------
+    maps: Iterable[Mapping]
+        the nested maps, e.g. a repos payload
+    paths: Mapping[str, Sequence]
+        column name to key path
+    default: Any
+        value for missing paths, which raise KeyError when not given
+    typecodes: Mapping[str, str]
+        ``array`` typecodes of numeric columns, other columns are lists
+    as_numpy: bool
+        return typed columns as NumPy arrays sharing the array's memory
+    defaults: Mapping[str, Any]
+        per column overrides of ``default``, e.g. 0 for typed columns
+    Example
+    -------
+    >>> columns = access_nested_map_many(
+    ...     repos, {"name": ["name"], "stars": ["stargazers_count"]},
+    ...     typecodes={"stars": "q"})
+    >>> columns["stars"]
+    array('q', [12, 292, ...])
+    """
+    typecodes = typecodes or {}
+    defaults = defaults or {}
+    if as_numpy and numpy is None:
+        raise ImportError("as_numpy=True requires numpy")
+    columns = {name: array(typecodes[name]) if name in typecodes else []
+               for name in paths}
+    steps = [(compile_path(path), columns[name].append,
+              defaults.get(name, default))
+             for name, path in paths.items()]
+
+    for nested_map in maps:
+        for access, append, missing in steps:
+            try:
+                append(access(nested_map))
+            except KeyError:
+                if missing is _ABSENT:
+                    raise
+                append(missing)
+
+    if as_numpy:
+        for name, typecode in typecodes.items():
+            columns[name] = numpy.frombuffer(columns[name], dtype=typecode)
+    return columns
+
+
+class CompactRecord(Mapping):
+    """Read-only mapping holding only projected fields of a nested map.
+    Values live in one tuple and the field names are shared by the
+    per-projection subclass, so a record costs a few dozen bytes plus its
+    values instead of a full dict. Nested projections are records too.
+    """
+    __slots__ = ("_values",)
+    _fields = ()
+    _index = {}
+
+    def __init__(self, values: Tuple) -> None:
+        """Init method of CompactRecord"""
+        self._values = values
+
+    def __getitem__(self, key: Any) -> Any:
+        """Value of a projected field present in the source map"""
+        value = self._values[self._index[key]]
+        if value is _ABSENT:
+            raise KeyError(key)
+        return value
+
+    def __iter__(self):
+        """Projected fields present in the source map"""
+        return (field for field, value in zip(self._fields, self._values)
+                if value is not _ABSENT)
+
+    def __len__(self) -> int:
+        """Number of projected fields present in the source map"""
+        return sum(value is not _ABSENT for value in self._values)
+
+    def __repr__(self) -> str:
+        """Show the record like the dict it stands for"""
+        return "{}({!r})".format(type(self).__name__, dict(self))
+
+
+def _record_type(fields: Tuple[str, ...]) -> type:
+    """A CompactRecord subclass for one tuple of field names"""
+    return type("Record", (CompactRecord,), {
+        "__slots__": (),
+        "_fields": fields,
+        "_index": {field: i for i, field in enumerate(fields)},
+    })
+
+
+def _projector(tree: Dict) -> Callable[[Any, Dict], Any]:
+    """Compile a field tree into a function projecting one value"""
+    fields = tuple(tree)
+    record = _record_type(fields)
+    children = [(field, _projector(tree[field]) if tree[field] else None)
+                for field in fields]
+
+    def project_one(value: Any, shared: Dict) -> Any:
+        """Project value, sharing equal nested records"""
+        if not isinstance(value, Mapping):
+            return value
+        values = tuple(
+            value.get(field, _ABSENT) if child is None
+            else child(value.get(field, _ABSENT), shared)
+            for field, child in children)
+        # typed, as 1 == True == 1.0; nested records are already shared,
+        # so identity tells them apart
+        key = (record, tuple(
+            (type(item), id(item) if isinstance(item, CompactRecord)
+             else item) for item in values))
+        try:
+            return shared.setdefault(key, record(values))
+        except TypeError:
+            # unhashable values, e.g. lists, are not shared
+            return record(values)
+    return project_one
+
+
+def project(maps: Sequence[Mapping], fields: Sequence[str]) -> List[Mapping]:
+    """Project nested maps onto compact read-only records.
+    Parameters
+    ----------
+    maps: Sequence[Mapping]
+        the nested maps, e.g. a repos payload
+    fields: Sequence[str]
+        the fields to keep, nested fields as dotted paths
+    Example
+    -------
+    >>> repos = project(payload, ("name", "license.key"))
+    >>> access_nested_map(repos[0], ("license", "key"))
+    'bsd-3-clause'
+    """
+    tree = {}
+    for field in fields:
+        node = tree
+        for key in field.split("."):
+            node = node.setdefault(key, {})
+    project_one = _projector(tree)
+    shared = {}
+    return [project_one(nested_map, shared) for nested_map in maps]
+
+
+JSON_DECODERS = {"json": json.loads}
+if orjson is not None:
+    JSON_DECODERS["orjson"] = orjson.loads
+
+# default decoder: a name in JSON_DECODERS or a callable taking bytes
+json_decoder = "orjson" if orjson is not None else "json"
+
+
+def decode_json(data: bytes, decoder: Any = None) -> Any:
+    """Decode a JSON document straight from its bytes.
+    Parameters
+    ----------
+    data: bytes
+        the encoded document, e.g. ``response.content``
+    decoder: str or Callable
+        a name in JSON_DECODERS or a callable, ``json_decoder`` when None
+    """
+    if decoder is None:
+        decoder = json_decoder
+    if isinstance(decoder, str):
+        decoder = JSON_DECODERS[decoder]
+    return decoder(data)
+
+
+class RateLimiter:
+    """Token bucket paced by GitHub's rate limit response headers.
+    ``X-RateLimit-Remaining`` and ``X-RateLimit-Reset`` set the refill
+    rate to the remaining quota spread evenly until the reset, so a long
+    sync keeps a steady pace instead of bursting into rejections. A
+    rejected call (``Retry-After``, or a 403/429 with no quota left)
+    blocks every caller until the server allows requests again. Callers
+    wait in ``acquire`` rather than fail; before the first response the
+    bucket does not throttle.
+    Parameters
+    ----------
+    burst: int
+        bucket capacity, the most calls let through back to back
+    """
+
+    def __init__(self, burst: int = 10) -> None:
+        """Init method of RateLimiter"""
+        self.burst = burst
+        self.rate = None
+        self.tokens = float(burst)
+        self.remaining = None
+        self.waits = 0
+        self.rejections = 0
+        self._updated = time.monotonic()
+        self._reset_at = None
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        """Add the tokens earned since the last refill"""
+        if self._reset_at is not None and now >= self._reset_at:
+            # a new quota window started, unthrottled until the next update
+            self.rate, self.tokens, self._reset_at = None, self.burst, None
+        if self.rate is not None:
+            self.tokens = min(self.burst, self.tokens
+                              + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self) -> None:
+        """Block until a request may be sent, then take a token"""
+        delay = self.reserve()
+        while delay:
+            time.sleep(delay)
+            delay = self.reserve()
+
+    def reserve(self) -> float:
+        """Take a token and return 0, or the seconds to wait before asking
+        again. The non-blocking half of ``acquire``, for asyncio callers.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if now < self._blocked_until:
+                delay = self._blocked_until - now
+            elif self.rate is None:
+                return 0
+            elif self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            else:
+                delay = (1 - self.tokens) / self.rate
+            self.waits += 1
+        return delay
+
+    def update(self, response: requests.Response) -> bool:
+        """Adapt to the headers of a response.
+        Returns True when the response is a rate limit rejection that
+        should be sent again once ``acquire`` lets it through.
+        """
+        headers = response.headers
+        remaining = _header_number(headers, "X-RateLimit-Remaining")
+        reset = _header_number(headers, "X-RateLimit-Reset")
+        retry_after = _header_number(headers, "Retry-After")
+        rejected = response.status_code in (403, 429) and (
+            retry_after is not None or remaining == 0)
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if remaining is not None and reset is not None:
+                until_reset = reset - time.time()
+                if until_reset > 0:
+                    self.remaining = remaining
+                    self.rate = remaining / until_reset
+                    self.tokens = min(self.tokens, remaining)
+                    self._reset_at = now + until_reset
+                    if remaining == 0:
+                        self._blocked_until = max(self._blocked_until,
+                                                  now + until_reset)
+            if retry_after is not None:
+                self._blocked_until = max(self._blocked_until,
+                                          now + retry_after)
+            if rejected:
+                self.rejections += 1
+        return rejected
+
+
+def _header_number(headers: Mapping, name: str) -> float:
+    """Numeric value of a header, None when missing or malformed"""
+    try:
+        return float(headers[name])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """Raised instead of sending a request to a host whose circuit is open
+    """
+
+
+class CircuitBreaker:
+    """Fail fast while a host keeps failing.
+    After ``failure_threshold`` consecutive failures the circuit opens
+    and calls are refused for ``reset_timeout`` seconds. Then a single
+    trial call is let through: its success closes the circuit, its
+    failure opens it again.
+    """
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half-open"
+
+    def __init__(self, failure_threshold: int = 5,
+                 reset_timeout: float = 30) -> None:
+        """Init method of CircuitBreaker"""
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Whether a call may be sent now"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if (self.state == self.OPEN and time.monotonic()
+                    - self._opened_at >= self.reset_timeout):
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def record_success(self) -> None:
+        """Close the circuit"""
+        with self._lock:
+            self.state, self.failures = self.CLOSED, 0
+
+    def release(self) -> None:
+        """Give back a half-open trial that ended without telling anything
+        about the host, e.g. when the caller was cancelled; the next call
+        becomes the trial. Nothing is counted.
+        """
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self.state = self.OPEN
+
+    def record_failure(self) -> None:
+        """Count a failure, opening the circuit past the threshold"""
+        with self._lock:
+            self.failures += 1
+            if (self.state == self.HALF_OPEN
+                    or self.failures >= self.failure_threshold):
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+
+
+class Transport:
+    """Shared keep-alive HTTP session used by get_json.
+    A single ``requests.Session`` is created on first use and reused from
+    every thread, so connections (and their TLS handshakes) are kept alive
+    across calls and across GithubOrgClient instances.
+    Parameters
+    ----------
+    pool_connections: int
+        number of per-host connection pools to keep
+    pool_maxsize: int
+        connections kept alive per host, should cover the page concurrency
+    rate_limiter: RateLimiter
+        paces every request, a new RateLimiter when None
+    rate_limit_retries: int
+        times a rate limited request is queued and sent again
+    timeout: Tuple[float, float]
+        default (connect, read) timeouts in seconds
+    retries: int
+        times a request failing with a connection error, a timeout or a
+        5xx status is sent again
+    backoff, max_backoff: float
+        the n-th retry waits a random time up to
+        ``min(max_backoff, backoff * 2 ** n)`` seconds
+    failure_threshold, reset_timeout
+        per host CircuitBreaker settings
+    """
+
+    def __init__(self, pool_connections: int = 10,
+                 pool_maxsize: int = 16, rate_limiter: RateLimiter = None,
+                 rate_limit_retries: int = 3,
+                 timeout: Tuple[float, float] = (3.05, 30),
+                 retries: int = 3, backoff: float = 0.5,
+                 max_backoff: float = 30, failure_threshold: int = 5,
+                 reset_timeout: float = 30) -> None:
+        """Init method of Transport"""
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.rate_limiter = (RateLimiter() if rate_limiter is None
+                             else rate_limiter)
+        self.rate_limit_retries = rate_limit_retries
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.metrics = Counter()
+        self._breakers = {}
+        self._session = None
+        self._lock = threading.Lock()
+
+    @property
+    def session(self) -> requests.Session:
+        """The pooled session, created on first use"""
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    self._session = self._new_session()
+        return self._session
+
+    def _new_session(self) -> requests.Session:
+        """Build a session mounting a pooled adapter for http and https"""
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=self.pool_connections,
+            pool_maxsize=self.pool_maxsize,
+        )
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def breaker(self, url: str) -> CircuitBreaker:
+        """The circuit breaker of the host of url"""
+        host = urlsplit(url).netloc
+        with self._lock:
+            breaker = self._breakers.get(host)
+            if breaker is None:
+                breaker = self._breakers[host] = CircuitBreaker(
+                    self.failure_threshold, self.reset_timeout)
+        return breaker
+
+    def _count(self, metric: str) -> None:
+        """Increment a metric"""
+        with self._lock:
+            self.metrics[metric] += 1
+
+    def stats(self) -> Dict[str, int]:
+        """Request, retry, failure and short circuit counters"""
+        with self._lock:
+            return dict(self.metrics)
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        """Send a GET request over the pooled session.
+        Connection errors, timeouts and 5xx responses are retried with
+        jittered exponential backoff while the host's circuit is closed;
+        once retries run out the last error is raised, or the last 5xx
+        response returned. Any other ``requests`` error is raised at once
+        and counts as a failure of the host; other exceptions are raised
+        without counting. CircuitOpenError is raised
+        without sending anything while the circuit is open.
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        breaker = self.breaker(url)
+        for attempt in range(self.retries + 1):
+            if not breaker.allow():
+                self._count("short_circuits")
+                raise CircuitOpenError(
+                    "circuit open for {}".format(urlsplit(url).netloc))
+            self._count("requests")
+            try:
+                response = self._send(url, kwargs)
+            except (requests.ConnectionError, requests.Timeout) as exc:
+                breaker.record_failure()
+                self._count("timeouts" if isinstance(exc, requests.Timeout)
+                            else "connection_errors")
+                if attempt == self.retries:
+                    raise
+            except requests.RequestException:
+                breaker.record_failure()
+                raise
+            except BaseException:
+                # caller side, e.g. bad arguments or KeyboardInterrupt:
+                # not the host's fault, but a half-open trial must end
+                breaker.release()
+                raise
+            else:
+                if response.status_code < 500:
+                    breaker.record_success()
+                    return response
+                breaker.record_failure()
+                self._count("server_errors")
+                if attempt == self.retries:
+                    return response
+                response.close()
+            self._count("retries")
+            time.sleep(random.uniform(
+                0, min(self.max_backoff, self.backoff * 2 ** attempt)))
+
+    def _send(self, url: str, kwargs: Dict) -> requests.Response:
+        """Send once the rate limiter allows, resending rate limited calls
+        """
+        for attempt in range(self.rate_limit_retries + 1):
+            self.rate_limiter.acquire()
+            response = self.session.get(url, **kwargs)
+            rejected = self.rate_limiter.update(response)
+            if not rejected or attempt == self.rate_limit_retries:
+                return response
+            response.close()
+
+    def close(self) -> None:
+        """Close every pooled connection, a new session is made on reuse"""
+        with self._lock:
+            session, self._session = self._session, None
+        if session is not None:
+            session.close()
+
+
+transport = Transport()
+
+
+class LRUCache:
+    """In-process response cache bounded by an estimated size in bytes.
+    Entries are evicted least recently used first once their total size
+    exceeds ``max_bytes``, so one huge org cannot crowd memory the way an
+    entry count bound lets it. Values are kept as the decoded objects
+    themselves, returned without copying. Drop-in for SQLiteCache as
+    ``response_cache``.
+    Parameters
+    ----------
+    max_bytes: int
+        budget for the total size of the entries; a single entry larger
+        than that is not stored
+    ttl: float
+        default seconds an entry stays fresh, as for SQLiteCache; None
+        for no expiry
+    sizeof: Callable[[Any], int]
+        size estimate of a value, a deep ``sys.getsizeof`` walk of its
+        dicts, lists and strings when None
+    maxsize: int
+        most entries kept, on top of the byte budget; None for no limit
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024,
+                 ttl: float = 3600, sizeof: Callable[[Any], int] = None,
+                 maxsize: int = None) -> None:
+        """Init method of LRUCache"""
+        self.max_bytes = max_bytes
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.sizeof = _deep_sizeof if sizeof is None else sizeof
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.oversized = 0
+        # key -> (value, size, monotonic expiry or None)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Any:
+        """Value of a fresh entry, raises KeyError on a miss"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry[2] is None
+                                      or entry[2] > time.monotonic()):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                self._discard(key)
+            self.misses += 1
+        raise KeyError(key)
+
+    def peek(self, key: Hashable) -> Any:
+        """Value of a fresh entry like get, but leaving its recency and
+        the hit and miss counters alone
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry[2] is None
+                                      or entry[2] > time.monotonic()):
+                return entry[0]
+        raise KeyError(key)
+
+    def set(self, key: Hashable, value: Any, ttl: float = None,
+            size: int = None) -> None:
+        """Store value, then evict down to the byte budget.
+        ``size`` overrides the estimate, e.g. with a content length.
+        """
+        if size is None:
+            size = self.sizeof(value)
+        ttl = self.ttl if ttl is None else ttl
+        expires = None if ttl is None else time.monotonic() + ttl
+        with self._lock:
+            self._discard(key)
+            if size > self.max_bytes:
+                self.oversized += 1
+                return
+            self._entries[key] = (value, size, expires)
+            self.bytes += size
+            while self.bytes > self.max_bytes or (
+                    self.maxsize is not None
+                    and len(self._entries) > self.maxsize):
+                self._discard(next(iter(self._entries)))
+                self.evictions += 1
+
+    def get_or_set(self, key: Hashable, compute: Callable[[], Any],
+                   ttl: float = None) -> Any:
+        """Value of key, computed and stored on a miss"""
+        try:
+            return self.get(key)
+        except KeyError:
+            pass
+        value = compute()
+        self.set(key, value, ttl)
+        return value
+
+    def _discard(self, key: Hashable) -> None:
+        """Drop an entry, if any, call with _lock held"""
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry[1]
+
+    def delete(self, key: Hashable) -> None:
+        """Forget one entry"""
+        with self._lock:
+            self._discard(key)
+
+    def keys(self) -> List[Hashable]:
+        """Snapshot of the stored keys, least recently used first"""
+        with self._lock:
+            return list(self._entries)
+
+    def __len__(self) -> int:
+        """Number of stored entries, expired ones included"""
+        return len(self._entries)
+
+    def clear(self) -> None:
+        """Forget every entry"""
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters, hit rate and current entry count and size"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses,
+                    "hit_rate": self.hits / lookups if lookups else None,
+                    "evictions": self.evictions,
+                    "oversized": self.oversized,
+                    "entries": len(self._entries), "bytes": self.bytes,
+                    "max_bytes": self.max_bytes}
+
+
+def _deep_sizeof(value: Any) -> int:
+    """Approximate bytes held by a decoded JSON value.
+    Sums ``sys.getsizeof`` over the value and everything reachable
+    through dicts, lists, tuples and CompactRecords, counting an object
+    shared between several places once.
+    """
+    seen = set()
+    size = 0
+    stack = [value]
+    while stack:
+        item = stack.pop()
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+        size += sys.getsizeof(item)
+        if isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple)):
+            stack.extend(item)
+        elif isinstance(item, CompactRecord):
+            stack.append(item._values)
+        elif isinstance(item, _MemoEntry):
+            stack.append(item.value)
+    return size
+
+
+class ValidatorCache:
+    """Bounded per-URL store of HTTP validators and decoded bodies.
+    Remembers the ``ETag`` and ``Last-Modified`` of each response so a
+    refetch can be made conditional; a ``304 Not Modified`` answer is then
+    served from the decoded body kept here, without parsing anything.
+    Entries live in an LRUCache charged the length of each response
+    body, so the kept bodies are bounded by ``max_bytes`` of JSON as
+    received as well as by ``maxsize`` entries.
+    """
+
+    def __init__(self, maxsize: int = 1024,
+                 max_bytes: int = 32 * 1024 * 1024) -> None:
+        """Init method of ValidatorCache"""
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        # validators never go stale, a 304 is what tells
+        self._entries = LRUCache(max_bytes=max_bytes, ttl=None,
+                                 maxsize=maxsize)
+
+    def headers(self, key: Hashable) -> Dict[str, str]:
+        """Conditional request headers for a previously seen key.
+        Not counted in stats, the lookup of a 304 is.
+        """
+        try:
+            etag, last_modified = self._entries.peek(key)[:2]
+        except KeyError:
+            return {}
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+        return headers
+
+    def lookup(self, key: Hashable) -> Tuple[Any, Dict]:
+        """Cached (payload, links) of a key, refreshing its recency"""
+        return self._entries.get(key)[2:]
+
+    def store(self, key: Hashable, response: requests.Response,
+              payload: Any, links: Dict) -> None:
+        """Keep payload and links when the response carries validators"""
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if not etag and not last_modified:
+            return
+        self._entries.set(key, (etag, last_modified, payload, links),
+                          size=len(response.content))
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters and current entry count and size, see LRUCache.
+        A hit is a 304 served from a kept body, a miss a 304 whose body
+        was evicted meanwhile.
+        """
+        return self._entries.stats()
+
+    def clear(self) -> None:
+        """Forget every validator"""
+        self._entries.clear()
+
+
+validator_cache = ValidatorCache()
+
+
+class SQLiteCache:
+    """Persistent JSON response cache stored in an SQLite database.
+    Entries are keyed by URL, expire after a per-entry TTL and are evicted
+    least recently used first once their encoded size exceeds
+    ``max_bytes``. The database runs in WAL mode so readers never block
+    the writer, and survives restarts of the process.
+    One database file can be shared by every worker process of a host:
+    each process (including one forked after the cache was created)
+    opens its own connection, writers wait up to ``busy_timeout`` for
+    each other, and ``get_or_set`` leases a missing key to one process
+    while the others wait for its value, so each payload is fetched once
+    per host.
+    Parameters
+    ----------
+    path: str
+        database file, ``":memory:"`` for a private in-memory cache
+    ttl: float
+        default seconds an entry stays fresh
+    max_bytes: int
+        budget for the total size of the encoded entries
+    busy_timeout: float
+        seconds to wait for another process's write to finish
+    lease_timeout: float
+        seconds other processes wait for a leased key before fetching it
+        themselves, in case its holder died
+    """
+    poll_interval = 0.05
+
+    def __init__(self, path: str, ttl: float = 3600,
+                 max_bytes: int = 256 * 1024 * 1024,
+                 busy_timeout: float = 30,
+                 lease_timeout: float = 30) -> None:
+        """Init method of SQLiteCache"""
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.busy_timeout = busy_timeout
+        self.lease_timeout = lease_timeout
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lease_waits = 0
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._db = self._connect()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open the database, creating its tables"""
+        db = sqlite3.connect(self.path, timeout=self.busy_timeout,
+                             check_same_thread=False, isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " key TEXT PRIMARY KEY, value BLOB NOT NULL,"
+            " size INTEGER NOT NULL, expires REAL NOT NULL,"
+            " accessed REAL NOT NULL)")
+        db.execute(
+            "CREATE INDEX IF NOT EXISTS entries_accessed"
+            " ON entries (accessed)")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS leases ("
+            " key TEXT PRIMARY KEY, owner TEXT NOT NULL,"
+            " expires REAL NOT NULL)")
+        return db
+
+    def _connection(self) -> sqlite3.Connection:
+        """Connection of the calling process, call with _lock held.
+        A forked child opens its own rather than share its parent's.
+        """
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._db = self._connect()
+        return self._db
+
+    def _read(self, key: str) -> Any:
+        """Encoded value of a fresh entry, None on a miss"""
+        now = time.time()
+        with self._lock:
+            db = self._connection()
+            row = db.execute(
+                "SELECT value FROM entries WHERE key = ? AND expires > ?",
+                (key, now)).fetchone()
+            if row is None:
+                return None
+            db.execute("UPDATE entries SET accessed = ? WHERE key = ?",
+                       (now, key))
+        return row[0]
+
+    def get(self, key: str) -> Any:
+        """Decoded value of a fresh entry, raises KeyError on a miss"""
+        data = self._read(key)
+        if data is None:
+            self.misses += 1
+            raise KeyError(key)
+        self.hits += 1
+        return decode_json(data)
+
+    def set(self, key: str, value: Any, ttl: float = None) -> None:
+        """Store a JSON serializable value, then enforce the byte budget"""
+        data = json.dumps(value, separators=(",", ":")).encode()
+        now = time.time()
+        expires = now + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            db = self._connection()
+            # one transaction, so concurrent processes agree on the budget
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                db.execute(
+                    "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)",
+                    (key, data, len(data), expires, now))
+                self._evict(db, now)
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            db.execute("COMMIT")
+
+    def get_or_set(self, key: str, compute: Callable[[], Any],
+                   ttl: float = None) -> Any:
+        """Value of key, computed and stored by one process on a miss.
+        The first process to miss takes a lease on key and computes it;
+        the others poll until its value is stored, the lease is released
+        without one, or ``lease_timeout`` passes, computing it themselves
+        in the last two cases.
+        """
+        try:
+            return self.get(key)
+        except KeyError:
+            pass
+        deadline = time.monotonic() + self.lease_timeout
+        leased = self._lease(key)
+        while not leased and time.monotonic() < deadline:
+            self.lease_waits += 1
+            time.sleep(self.poll_interval)
+            data = self._read(key)
+            if data is not None:
+                return decode_json(data)
+            leased = self._lease(key)
+        try:
+            # the previous holder may have stored it since our miss
+            data = self._read(key) if leased else None
+            if data is not None:
+                return decode_json(data)
+            value = compute()
+            self.set(key, value, ttl)
+        finally:
+            if leased:
+                self._release(key)
+        return value
+
+    def _owner(self) -> str:
+        """Lease owner name of this cache in the calling process"""
+        return "{}:{}".format(os.getpid(), id(self))
+
+    def _lease(self, key: str) -> bool:
+        """Take the lease on key unless another live lease holds it"""
+        now = time.time()
+        with self._lock:
+            db = self._connection()
+            db.execute("DELETE FROM leases WHERE key = ? AND expires <= ?",
+                       (key, now))
+            cursor = db.execute(
+                "INSERT OR IGNORE INTO leases VALUES (?, ?, ?)",
+                (key, self._owner(), now + self.lease_timeout))
+        return cursor.rowcount == 1
+
+    def _release(self, key: str) -> None:
+        """Give up the lease on key"""
+        with self._lock:
+            self._connection().execute(
+                "DELETE FROM leases WHERE key = ? AND owner = ?",
+                (key, self._owner()))
+
+    def _evict(self, db: sqlite3.Connection, now: float) -> None:
+        """Drop expired entries, then the least recently used ones"""
+        db.execute("DELETE FROM entries WHERE expires <= ?", (now,))
+        total = db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = db.execute(
+            "SELECT key, size FROM entries ORDER BY accessed").fetchall()
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            db.execute("DELETE FROM entries WHERE key = ?", (key,))
+            total -= size
+            self.evictions += 1
+
+    def delete(self, key: str) -> None:
+        """Forget one entry"""
+        with self._lock:
+            self._connection().execute(
+                "DELETE FROM entries WHERE key = ?", (key,))
+
+    def clear(self) -> None:
+        """Forget every entry"""
+        with self._lock:
+            self._connection().execute("DELETE FROM entries")
+
+    def stats(self) -> Dict[str, int]:
+        """Hit/miss counters and current entry count and size"""
+        with self._lock:
+            entries, size = self._connection().execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0)"
+                " FROM entries").fetchone()
+        return {"hits": self.hits, "misses": self.misses,
+                "evictions": self.evictions,
+                "lease_waits": self.lease_waits, "entries": entries,
+                "bytes": size}
+
+    def close(self) -> None:
+        """Close the database connection"""
+        with self._lock:
+            self._db.close()
+
+
+class SingleFlight:
+    """Run at most one call per key at a time and share its outcome.
+    Callers arriving while a call for their key is in flight wait for it
+    and get its result, or its exception, instead of calling again.
+    """
+
+    def __init__(self) -> None:
+        """Init method of SingleFlight"""
+        self.calls = 0
+        self.shared = 0
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        """Call fn unless a call for key is in flight, then join it"""
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+                self.calls += 1
+            else:
+                self.shared += 1
+        if not leader:
+            return future.result()
+        try:
+            result = fn()
+        except BaseException as exc:
+            future.set_exception(exc)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    def stats(self) -> Dict[str, int]:
+        """Calls made and calls that joined one in flight instead"""
+        with self._lock:
+            return {"calls": self.calls, "shared": self.shared,
+                    "in_flight": len(self._calls)}
+
+
+# concurrent get_json / get_json_paginated calls for one key share a
+# result, and concurrent HTTP requests for one URL share a response
+result_flight = SingleFlight()
+request_flight = SingleFlight()
+
+response_cache = None
+
+# set while memoize recomputes a value it already had: reads then skip
+# response_cache and revalidate with the origin, storing the result
+_revalidating = contextvars.ContextVar("revalidating", default=False)
+
+
+class _UncachedResponse(Exception):
+    """Carries the decoded body of a non-2xx response past the caches"""
+
+    def __init__(self, payload: Any) -> None:
+        """Init method of _UncachedResponse"""
+        super().__init__(payload)
+        self.payload = payload
+
+
+def _cached(key: str, fetch: Callable[[], Any]) -> Any:
+    """Serve key from response_cache when enabled, else fetch and store.
+    Concurrent callers for one key share a single lookup and fetch. A
+    non-2xx body is returned without being stored. While revalidating
+    the cached entry is bypassed and replaced.
+    """
+    revalidate = _revalidating.get()
+    try:
+        return result_flight.do(
+            (key, revalidate), lambda: _cached_once(key, fetch, revalidate))
+    except _UncachedResponse as exc:
+        return exc.payload
+
+
+def _cached_once(key: str, fetch: Callable[[], Any],
+                 revalidate: bool) -> Any:
+    """Cache lookup, then fetch and store on a miss"""
+    cache = response_cache
+    if cache is None:
+        return fetch()
+    if not revalidate:
+        return cache.get_or_set(key, fetch)
+    value = fetch()
+    cache.set(key, value)
+    return value
+
+
+def _fetch(url: str, params: Dict = None,
+           decoder: Any = None) -> Tuple[Any, Dict]:
+    """Get decoded JSON and the parsed Link header from remote URL.
+    The request is conditional when validators for it are cached, and
+    shared with every concurrent request for the same URL.
+    """
+    key = (url, tuple(sorted(params.items())) if params else ())
+    return request_flight.do(key, lambda: _fetch_once(url, params, decoder,
+                                                      key))
+
+
+def _fetch_once(url: str, params: Dict, decoder: Any,
+                key: Hashable) -> Tuple[Any, Dict]:
+    """Send the request of _fetch"""
+    response = transport.get(url, params=params,
+                             headers=validator_cache.headers(key))
+    if response.status_code == 304:
+        try:
+            return validator_cache.lookup(key)
+        except KeyError:
+            # evicted meanwhile, ask again without validators
+            response = transport.get(url, params=params, headers={})
+    payload = decode_json(response.content, decoder)
+    if not 200 <= response.status_code < 300:
+        # errors, e.g. a rate limit 403, must not outlive the response
+        raise _UncachedResponse(payload)
+    links = response.links
+    validator_cache.store(key, response, payload, links)
+    return payload, links
+
+
+def get_json(url: str, decoder: Any = None) -> Dict:
     """Get JSON from remote URL.
+    ``decoder`` is passed to decode_json. The body of a non-2xx response
+    is returned but not cached.
+    """
+    return _cached(url, lambda: _fetch(url, decoder=decoder)[0])
+
+
+PAGE_CONCURRENCY = 8
+
+
+def _page_urls(last_url: str) -> List[str]:
+    """URLs of pages 2..N given the URL of the last page N.
+    Returns an empty list when the last URL carries no page number.
+    """
+    parts = urlsplit(last_url)
+    query = parse_qs(parts.query, keep_blank_values=True)
+    try:
+        last_page = int(query["page"][0])
+    except (KeyError, ValueError):
+        return []
+    urls = []
+    for page in range(2, last_page + 1):
+        query["page"] = [str(page)]
+        urls.append(urlunsplit(parts._replace(
+            query=urlencode(query, doseq=True))))
+    return urls
+
+
+def get_json_paginated(url: str, per_page: int = None,
+                       concurrency: int = PAGE_CONCURRENCY,
+                       decoder: Any = None) -> List:
+    """Get every page of a paginated JSON list from remote URL.
+    When the first response advertises ``rel="last"`` the remaining pages
+    are fetched on a pool of at most ``concurrency`` threads and
+    reassembled in order; otherwise ``rel="next"`` links are followed one
+    page at a time.
+    Parameters
+    ----------
+    url: str
+        URL of the first page
+    per_page: int
+        page size to request, GitHub accepts at most 100
+    concurrency: int
+        maximum number of pages fetched at the same time
+    decoder: str or Callable
+        passed to decode_json
     """
-    response = requests.get(url)
-    return response.json()
+    key = _pages_key(url, per_page)
+    return _cached(key, lambda: _fetch_pages(url, per_page, concurrency,
+                                             decoder))
+
+
+def _pages_key(url: str, per_page: int) -> str:
+    """Cache key of every page of url, apart from get_json's key for url
+    alone (a URL never contains a space)
+    """
+    key = "{} pages".format(url)
+    if per_page is not None:
+        key += " per_page={}".format(per_page)
+    return key
+
+
+def _fetch_pages(url: str, per_page: int, concurrency: int,
+                 decoder: Any) -> List:
+    """Fetch and concatenate every page, see get_json_paginated"""
+    params = None if per_page is None else {"per_page": per_page}
+    page, links = _fetch(url, params, decoder)
+    payload = list(page)
+
+    urls = _page_urls(links["last"]["url"]) if "last" in links else []
+    if urls and concurrency > 1:
+        with ThreadPoolExecutor(min(concurrency, len(urls))) as executor:
+            pages = executor.map(
+                lambda url: _fetch(url, decoder=decoder)[0], urls)
+            for page in pages:
+                payload.extend(page)
+        return payload
+
+    url = links.get("next", {}).get("url")
+    while url:
+        # the next link already carries the full query string
+        page, links = _fetch(url, decoder=decoder)
+        payload.extend(page)
+        url = links.get("next", {}).get("url")
+    return payload
+
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_json_decoder = json.JSONDecoder()
+
+
+def iter_json_array(chunks: Iterable[bytes]) -> Iterator[Any]:
+    """Decode the items of a top-level JSON array as its bytes arrive.
+    Only the undecoded tail of the body is buffered, so memory is bounded
+    by the largest item rather than the whole array.
+    Parameters
+    ----------
+    chunks: Iterable[bytes]
+        UTF-8 encoded body, split anywhere
+    """
+    text = codecs.getincrementaldecoder("utf-8")()
+    buffer, started, items, separated = "", False, 0, True
+    chunks = iter(chunks)
+    done = False
+    while not done:
+        chunk = next(chunks, None)
+        done = chunk is None
+        buffer += text.decode(b"" if done else chunk, final=done)
+        pos = 0
+        while True:
+            pos = _WHITESPACE.match(buffer, pos).end()
+            if pos == len(buffer):
+                break
+            char = buffer[pos]
+            if not started:
+                if char != "[":
+                    raise json.JSONDecodeError("Expecting '['", buffer, pos)
+                started, pos = True, pos + 1
+            elif char == "]" and (not separated or not items):
+                return
+            elif char == "," and not separated:
+                separated, pos = True, pos + 1
+            elif not separated:
+                raise json.JSONDecodeError(
+                    "Expecting ',' delimiter", buffer, pos)
+            else:
+                try:
+                    item, end = _json_decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError:
+                    if done:
+                        raise
+                    break
+                # a number may still be growing until a delimiter arrives
+                if not done and (end == len(buffer)
+                                 or buffer[end] not in " \t\n\r,]"):
+                    break
+                yield item
+                items, separated, pos = items + 1, False, end
+        buffer = buffer[pos:]
+    raise json.JSONDecodeError("Unterminated array", buffer, len(buffer))
+
+
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def iter_json(url: str, per_page: int = None) -> Iterator[Any]:
+    """Yield the items of a paginated JSON list while it downloads.
+    Each page is streamed and decoded item by item, and the next page is
+    only requested once the previous one is consumed. Streamed responses
+    bypass the response and validator caches.
+    Parameters
+    ----------
+    url: str
+        URL of the first page
+    per_page: int
+        page size to request, GitHub accepts at most 100
+    """
+    params = None if per_page is None else {"per_page": per_page}
+    while url:
+        response = transport.get(url, params=params, stream=True)
+        try:
+            yield from iter_json_array(
+                response.iter_content(STREAM_CHUNK_SIZE))
+            url = response.links.get("next", {}).get("url")
+        finally:
+            response.close()
+        params = None
+
+
+class MemoRegistry:
+    """Bounded LRU of memoized values shared between instances.
+    Keys are ``(owner class, method name, key)`` tuples built by
+    ``memoize(key=...)``, so every instance that maps to the same key
+    reuses one value until it is evicted or invalidated. Entries live in
+    an LRUCache charged the deep size of each value, so whole payloads
+    kept for many orgs stay within ``max_bytes``; a value larger than
+    that is not kept and is recomputed on each access.
+    Parameters
+    ----------
+    maxsize: int
+        most entries kept
+    max_bytes: int
+        budget for the estimated total size of the values
+    """
+
+    def __init__(self, maxsize: int = 1024,
+                 max_bytes: int = 256 * 1024 * 1024) -> None:
+        """Init method of MemoRegistry"""
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        # memoize keeps its own TTLs on the entries
+        self._entries = LRUCache(max_bytes=max_bytes, ttl=None,
+                                 maxsize=maxsize)
+
+    def get(self, key: Hashable) -> Any:
+        """Value stored under key, raises KeyError on a miss"""
+        return self._entries.get(key)
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """Store value, evicting the least recently used beyond the
+        entry and byte bounds
+        """
+        self._entries.set(key, value)
+
+    def delete(self, key: Hashable) -> None:
+        """Drop the entry stored under key, if any"""
+        self._entries.delete(key)
+
+    def invalidate(self, owner: type = None, name: str = None,
+                   key: Hashable = None) -> int:
+        """Drop the values of the entries matching every given part of
+        their key. Each is left as a tombstone, so memoize refetches it
+        from the origin rather than from response_cache.
+        Returns the number of dropped entries.
+        Example
+        -------
+        >>> memo_registry.invalidate(GithubOrgClient, key="google")
+        """
+        pattern = (owner, name, key)
+        stale = [
+            entry for entry in self._entries.keys()
+            if all(part is None or part == actual
+                   for part, actual in zip(pattern, entry))
+        ]
+        for entry in stale:
+            self._entries.set(entry, _MemoEntry(_ABSENT))
+        return len(stale)
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters, hit rate and current entry count and size"""
+        return self._entries.stats()
+
+    def clear(self) -> None:
+        """Drop every entry"""
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        """Number of stored entries"""
+        return len(self._entries)
+
+
+memo_registry = MemoRegistry()
+
+
+class _MemoEntry:
+    """A memoized value, the monotonic time it was computed at and what
+    the attribute it depends on was at that time. An invalidated value
+    is _ABSENT. ``token`` identifies the value to the entries depending
+    on it, which keep the token rather than the value itself.
+    """
+    __slots__ = ("value", "created", "source", "token")
+
+    def __init__(self, value: Any, source: Any = None,
+                 token: object = None) -> None:
+        """Init method of _MemoEntry"""
+        self.value = value
+        self.created = time.monotonic()
+        self.source = source
+        self.token = object() if token is None else token
+
+
+def _unchanged(entry: _MemoEntry, value: Any) -> Any:
+    """The previous value when value equals it, else value.
+    Keeping the old object lets values depending on it stay valid.
+    """
+    if entry is None or entry.value is _ABSENT:
+        return value
+    try:
+        if value is entry.value or value == entry.value:
+            return entry.value
+    except (TypeError, ValueError):
+        pass
+    return value
+
+
+class _Memoized:
+    """Descriptor behind memoize, see there for the options.
+    Accessing it on the class returns the descriptor itself, which exposes
+    ``invalidate(instance)`` and ``refresh(instance)``.
+    """
+
+    def __init__(self, fn: Callable, key: Callable = None,
+                 registry: MemoRegistry = None, ttl: float = None,
+                 depends_on: str = None,
+                 refresh_after: float = None) -> None:
+        """Init method of _Memoized"""
+        update_wrapper(self, fn)
+        self.fn = fn
+        self.key = key
+        self.registry = registry
+        self.ttl = ttl
+        self.depends_on = depends_on
+        self.refresh_after = refresh_after
+        self.attr_name = "_{}".format(fn.__name__)
+        self._flight = SingleFlight()
+        # flight keys with a background refresh under way
+        self._revalidating = set()
+        self._lock = threading.Lock()
+        # storage for instances whose __slots__ lack a slot for attr_name
+        self._slotless = weakref.WeakKeyDictionary()
+
+    def __get__(self, instance: Any, owner: type = None) -> Any:
+        """Memoized value of instance, computed once on a miss"""
+        if instance is None:
+            return self
+        entry = self._load(instance)
+        if entry is not None and self._fresh(entry, self._source(instance),
+                                             instance):
+            if self._stale(entry, instance):
+                self._revalidate(instance)
+            return entry.value
+        return self._flight.do(self._flight_key(instance),
+                               lambda: self._compute(instance, False))
+
+    def __set__(self, instance: Any, value: Any) -> None:
+        """Memoized attributes are read-only, like a property"""
+        raise AttributeError("can't set attribute")
+
+    def invalidate(self, instance: Any) -> None:
+        """Forget the value of instance, the next access recomputes it,
+        revalidating with the origin
+        """
+        self._store(instance, _MemoEntry(_ABSENT))
+
+    def refresh(self, instance: Any) -> Any:
+        """Recompute the value of instance now and return it"""
+        return self._flight.do(self._flight_key(instance),
+                               lambda: self._compute(instance, True))
+
+    def _source(self, instance: Any) -> Any:
+        """Identity of the attribute depended on, if any: the token of
+        its entry when it is memoized too, so an evicted or refreshed
+        payload is not kept alive by the values derived from it, else
+        its current value
+        """
+        if self.depends_on is None:
+            return None
+        value = getattr(instance, self.depends_on)
+        dependency = getattr(type(instance), self.depends_on, None)
+        if isinstance(dependency, _Memoized):
+            entry = dependency._load(instance)
+            if entry is not None and entry.value is value:
+                return entry.token
+        return value
+
+    @staticmethod
+    def _seconds(option: Any, instance: Any) -> float:
+        """An age option, read from instance when it names an attribute"""
+        if isinstance(option, str):
+            return getattr(instance, option)
+        return option
+
+    def _fresh(self, entry: _MemoEntry, source: Any,
+               instance: Any) -> bool:
+        """Whether entry is within its TTL and built from source"""
+        if entry.value is _ABSENT or entry.source is not source:
+            return False
+        ttl = self._seconds(self.ttl, instance)
+        return ttl is None or time.monotonic() - entry.created < ttl
+
+    def _stale(self, entry: _MemoEntry, instance: Any) -> bool:
+        """Whether entry is past refresh_after and due a refresh"""
+        refresh_after = self._seconds(self.refresh_after, instance)
+        return (refresh_after is not None
+                and time.monotonic() - entry.created >= refresh_after)
+
+    def _revalidate(self, instance: Any) -> None:
+        """Refresh the value of instance on a background thread, unless a
+        refresh of it is already under way
+        """
+        flight_key = self._flight_key(instance)
+        with self._lock:
+            if flight_key in self._revalidating:
+                return
+            self._revalidating.add(flight_key)
+
+        def refresh() -> None:
+            """Recompute, keeping the stale value when that fails"""
+            try:
+                self.refresh(instance)
+            except Exception:
+                pass
+            finally:
+                with self._lock:
+                    self._revalidating.discard(flight_key)
+        threading.Thread(target=refresh, daemon=True).start()
 
+    def _compute(self, instance: Any, force: bool) -> Any:
+        """Compute and store, unless another caller stored it meanwhile.
+        Recomputing a value already had revalidates with the origin.
+        """
+        source = self._source(instance)
+        entry = self._load(instance)
+        if not force and entry is not None and self._fresh(entry, source,
+                                                           instance):
+            return entry.value
+        token = _revalidating.set(force or entry is not None)
+        try:
+            value = self.fn(instance)
+        finally:
+            _revalidating.reset(token)
+        kept = _unchanged(entry, value)
+        # an unchanged value keeps its token, its dependents stay valid
+        token = None
+        if entry is not None and kept is entry.value:
+            token = entry.token
+        entry = _MemoEntry(kept, source, token)
+        self._store(instance, entry)
+        return entry.value
 
-def memoize(fn: Callable) -> Callable:
+    def _registry(self) -> MemoRegistry:
+        """The registry shared values live in"""
+        return memo_registry if self.registry is None else self.registry
+
+    def _cache_key(self, instance: Any) -> Tuple:
+        """Registry key of instance"""
+        return (type(instance), self.fn.__name__, self.key(instance))
+
+    def _flight_key(self, instance: Any) -> Hashable:
+        """Key under which concurrent computations are merged"""
+        if self.key is not None:
+            return self._cache_key(instance)
+        return id(instance)
+
+    def _load(self, instance: Any) -> _MemoEntry:
+        """Stored entry of instance, None when there is none"""
+        if self.key is not None:
+            try:
+                return self._registry().get(self._cache_key(instance))
+            except KeyError:
+                return None
+        try:
+            return getattr(instance, self.attr_name)
+        except AttributeError:
+            pass
+        try:
+            return self._slotless.get(instance)
+        except TypeError:
+            return None
+
+    def _store(self, instance: Any, entry: _MemoEntry) -> None:
+        """Store entry for instance"""
+        if self.key is not None:
+            self._registry().set(self._cache_key(instance), entry)
+            return
+        try:
+            setattr(instance, self.attr_name, entry)
+        except AttributeError:
+            try:
+                self._slotless[instance] = entry
+            except TypeError:
+                raise TypeError(
+                    "memoize needs a {!r} or __weakref__ slot on {}".format(
+                        self.attr_name, type(instance).__name__)) from None
+
+
+def memoize(fn: Callable = None, *, key: Callable[[Any], Hashable] = None,
+            registry: MemoRegistry = None, ttl: float = None,
+            depends_on: str = None,
+            refresh_after: float = None) -> Callable:
     """Decorator to memoize a method.
+    By default the result is stored on the instance, in ``_<method>``
+    (declare that slot, or ``__weakref__``, on classes using
+    ``__slots__``). With ``key`` it is stored in a MemoRegistry
+    (``memo_registry`` unless ``registry`` is given) under
+    ``(class, method name, key(instance))`` and shared by every instance
+    producing the same key.
+    Concurrent first accesses run the method once, the other callers
+    wait for its result. With ``ttl`` a result older than ``ttl`` seconds
+    is recomputed on the next access. With ``refresh_after`` a result
+    that old is still returned at once, and recomputed on a background
+    thread for the next accesses (stale-while-revalidate); only past
+    ``ttl`` do callers wait, and a failed background refresh keeps the
+    stale value. ``ttl`` and ``refresh_after`` may also name an
+    attribute of the instance holding the seconds, so subclasses can
+    tune them. With ``depends_on`` naming another
+    attribute, the result is also recomputed whenever that attribute
+    no longer returns the very object it was computed from, which suits
+    values derived from another memoized payload.
+    ``MyClass.a_method.invalidate(obj)`` and
+    ``MyClass.a_method.refresh(obj)`` drop or recompute a value.
     Example
     -------
     class MyClass:
@@ -62,14 +1731,431 @@ def memoize(fn: Callable) -> Callable:
     42
     >>> my_object.a_method
     42
+    class Org:
+        def __init__(self, name):
+            self.name = name
+        @memoize(key=lambda self: self.name, ttl=60)
+        def payload(self):
+            print("payload called")
+            return {}
+    >>> Org("google").payload
+    payload called
+    {}
+    >>> Org("google").payload
+    {}
+    """
+    if fn is None:
+        return lambda fn: memoize(fn, key=key, registry=registry, ttl=ttl,
+                                  depends_on=depends_on,
+                                  refresh_after=refresh_after)
+    return _Memoized(fn, key=key, registry=registry, ttl=ttl,
+                     depends_on=depends_on, refresh_after=refresh_after)
+
+
+class AsyncSingleFlight:
+    """asyncio counterpart of SingleFlight.
+    The first caller for a key starts a task, callers arriving while it
+    runs await that same task. Each awaiter is shielded, so cancelling one
+    of them leaves the shared task running for the others.
+    """
+
+    def __init__(self) -> None:
+        """Init method of AsyncSingleFlight"""
+        self.calls = 0
+        self.shared = 0
+        self._tasks = {}
+
+    async def do(self, key: Hashable,
+                 fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Await fn() unless a call for key is in flight, then join it"""
+        key = (asyncio.get_running_loop(), key)
+        task = self._tasks.get(key)
+        if task is None:
+            task = self._tasks[key] = asyncio.ensure_future(fn())
+            task.add_done_callback(lambda done: self._forget(key, done))
+            self.calls += 1
+        else:
+            self.shared += 1
+        return await asyncio.shield(task)
+
+    def _forget(self, key: Hashable, task: asyncio.Future) -> None:
+        """Drop a finished task, unless a newer one took its key"""
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+
+    def stats(self) -> Dict[str, int]:
+        """Calls made and calls that joined one in flight instead"""
+        return {"calls": self.calls, "shared": self.shared,
+                "in_flight": len(self._tasks)}
+
+
+class AsyncResponse:
+    """Status, headers and body of a response read by AsyncTransport,
+    with the attributes get_json uses from ``requests.Response``
+    """
+    __slots__ = ("status_code", "headers", "content")
+
+    def __init__(self, status_code: int, headers: Mapping,
+                 content: bytes) -> None:
+        """Init method of AsyncResponse"""
+        self.status_code = status_code
+        self.headers = requests.structures.CaseInsensitiveDict(headers)
+        self.content = content
+
+    @property
+    def links(self) -> Dict[str, Dict]:
+        """Parsed Link header, keyed like ``requests.Response.links``"""
+        links = {}
+        header = self.headers.get("Link")
+        if header:
+            for link in requests.utils.parse_header_links(header):
+                links[link.get("rel") or link.get("url")] = link
+        return links
+
+
+class AsyncTransport:
+    """Non-blocking HTTP GETs for the async_get_json family.
+    With aiohttp installed, requests go out on one pooled
+    ``aiohttp.ClientSession`` per event loop; without it they are handed
+    to the blocking transport on a worker thread. Either way the rate
+    limiter, circuit breakers, timeouts and retry settings of the
+    blocking transport apply, and its metrics count the requests.
+    Parameters
+    ----------
+    transport: Transport
+        settings to share, the module level ``transport`` when None
+    limit: int
+        connections kept open per event loop
+    """
+
+    def __init__(self, transport: Transport = None,
+                 limit: int = 100) -> None:
+        """Init method of AsyncTransport"""
+        self.transport = transport
+        self.limit = limit
+        self._sessions = weakref.WeakKeyDictionary()
+
+    def _base(self) -> Transport:
+        """The blocking transport whose settings apply"""
+        return transport if self.transport is None else self.transport
+
+    def session(self) -> "aiohttp.ClientSession":
+        """The pooled session of the running loop, created on first use"""
+        loop = asyncio.get_running_loop()
+        session = self._sessions.get(loop)
+        if session is None or session.closed:
+            timeout = self._base().timeout
+            if not isinstance(timeout, tuple):
+                timeout = (timeout, timeout)
+            session = self._sessions[loop] = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.limit),
+                timeout=aiohttp.ClientTimeout(sock_connect=timeout[0],
+                                              sock_read=timeout[1]))
+        return session
+
+    async def get(self, url: str, params: Dict = None,
+                  headers: Dict = None) -> Any:
+        """Send a GET request without blocking the event loop.
+        Retries and raises like ``Transport.get``; aiohttp errors and
+        timeouts take the place of their ``requests`` counterparts.
+        """
+        base = self._base()
+        if aiohttp is None:
+            return await asyncio.to_thread(base.get, url, params=params,
+                                           headers=headers)
+        breaker = base.breaker(url)
+        for attempt in range(base.retries + 1):
+            if not breaker.allow():
+                base._count("short_circuits")
+                raise CircuitOpenError(
+                    "circuit open for {}".format(urlsplit(url).netloc))
+            base._count("requests")
+            try:
+                response = await self._send(base, url, params, headers)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as exc:
+                breaker.record_failure()
+                base._count("timeouts"
+                            if isinstance(exc, asyncio.TimeoutError)
+                            else "connection_errors")
+                if attempt == base.retries:
+                    raise
+            except BaseException:
+                # caller side, e.g. cancellation: not the host's fault,
+                # but a half-open trial must end
+                breaker.release()
+                raise
+            else:
+                if response.status_code < 500:
+                    breaker.record_success()
+                    return response
+                breaker.record_failure()
+                base._count("server_errors")
+                if attempt == base.retries:
+                    return response
+            base._count("retries")
+            await asyncio.sleep(random.uniform(
+                0, min(base.max_backoff, base.backoff * 2 ** attempt)))
+
+    async def _send(self, base: Transport, url: str, params: Dict,
+                    headers: Dict) -> AsyncResponse:
+        """Send once the rate limiter allows, resending rate limited calls
+        """
+        limiter = base.rate_limiter
+        for attempt in range(base.rate_limit_retries + 1):
+            delay = limiter.reserve()
+            while delay:
+                await asyncio.sleep(delay)
+                delay = limiter.reserve()
+            async with self.session().get(url, params=params,
+                                          headers=headers) as raw:
+                response = AsyncResponse(raw.status, raw.headers,
+                                         await raw.read())
+            rejected = limiter.update(response)
+            if not rejected or attempt == base.rate_limit_retries:
+                return response
+
+    async def close(self) -> None:
+        """Close the session of the running loop, if any"""
+        session = self._sessions.pop(asyncio.get_running_loop(), None)
+        if session is not None:
+            await session.close()
+
+
+async_transport = AsyncTransport()
+
+# threads running response_cache calls for async_get_json, at most
+# CACHE_THREADS distinct keys are looked up or fetched at once
+CACHE_THREADS = 32
+_cache_executor = ThreadPoolExecutor(CACHE_THREADS,
+                                     thread_name_prefix="response-cache")
+
+# the async_get_json counterparts of result_flight and request_flight
+async_result_flight = AsyncSingleFlight()
+async_request_flight = AsyncSingleFlight()
+
+
+async def _async_cached(key: str,
+                        fetch: Callable[[], Awaitable[Any]]) -> Any:
+    """asyncio counterpart of _cached"""
+    revalidate = _revalidating.get()
+    try:
+        return await async_result_flight.do(
+            (key, revalidate),
+            lambda: _async_cached_once(key, fetch, revalidate))
+    except _UncachedResponse as exc:
+        return exc.payload
+
+
+async def _async_cached_once(key: str, fetch: Callable[[], Awaitable[Any]],
+                             revalidate: bool) -> Any:
+    """Cache lookup, then fetch and store on a miss.
+    The cache is used from a _cache_executor thread, as it may block on
+    another process (an SQLite write or a lease held elsewhere); a miss
+    is still fetched on this loop. That thread waits for the fetch, so
+    it must not come from the loop's default executor, which the fetch
+    itself may need.
     """
-    attr_name = "_{}".format(fn.__name__)
+    cache = response_cache
+    if cache is None:
+        return await fetch()
+    loop = asyncio.get_running_loop()
+    if revalidate:
+        value = await fetch()
+        await loop.run_in_executor(_cache_executor, cache.set, key, value)
+        return value
 
-    @wraps(fn)
-    def memoized(self):
-        """"memoized wraps"""
-        if not hasattr(self, attr_name):
-            setattr(self, attr_name, fn(self))
-        return getattr(self, attr_name)
+    def compute() -> Any:
+        """Run fetch on the loop and wait for it from the worker"""
+        return asyncio.run_coroutine_threadsafe(fetch(), loop).result()
+    return await loop.run_in_executor(_cache_executor, cache.get_or_set,
+                                      key, compute)
 
-    return property(memoized)
+
+async def _async_fetch(url: str, params: Dict = None,
+                       decoder: Any = None) -> Tuple[Any, Dict]:
+    """asyncio counterpart of _fetch"""
+    key = (url, tuple(sorted(params.items())) if params else ())
+    return await async_request_flight.do(
+        key, lambda: _async_fetch_once(url, params, decoder, key))
+
+
+async def _async_fetch_once(url: str, params: Dict, decoder: Any,
+                            key: Hashable) -> Tuple[Any, Dict]:
+    """Send the request of _async_fetch"""
+    response = await async_transport.get(
+        url, params=params, headers=validator_cache.headers(key))
+    if response.status_code == 304:
+        try:
+            return validator_cache.lookup(key)
+        except KeyError:
+            # evicted meanwhile, ask again without validators
+            response = await async_transport.get(url, params=params,
+                                                 headers={})
+    payload = decode_json(response.content, decoder)
+    if not 200 <= response.status_code < 300:
+        # errors, e.g. a rate limit 403, must not outlive the response
+        raise _UncachedResponse(payload)
+    links = response.links
+    validator_cache.store(key, response, payload, links)
+    return payload, links
+
+
+async def _async_payload(url: str, params: Dict = None,
+                         decoder: Any = None) -> Any:
+    """Decoded JSON of _async_fetch, without the links"""
+    return (await _async_fetch(url, params, decoder))[0]
+
+
+async def async_get_json(url: str, decoder: Any = None) -> Dict:
+    """Get JSON from remote URL without blocking the event loop.
+    Shares response_cache, including its cross-process leases, and the
+    conditional request validators with get_json; concurrent awaiters
+    for one URL share one request.
+    """
+    return await _async_cached(url, lambda: _async_payload(
+        url, decoder=decoder))
+
+
+async def async_get_json_paginated(url: str, per_page: int = None,
+                                   concurrency: int = PAGE_CONCURRENCY,
+                                   decoder: Any = None) -> List:
+    """Get every page of a paginated JSON list without blocking.
+    Like get_json_paginated, with the remaining pages awaited together,
+    at most ``concurrency`` at a time, instead of on a thread pool.
+    """
+    key = _pages_key(url, per_page)
+    return await _async_cached(key, lambda: _async_fetch_pages(
+        url, per_page, concurrency, decoder))
+
+
+async def _async_fetch_pages(url: str, per_page: int, concurrency: int,
+                             decoder: Any) -> List:
+    """Fetch and concatenate every page, see async_get_json_paginated"""
+    params = None if per_page is None else {"per_page": per_page}
+    page, links = await _async_fetch(url, params, decoder)
+    payload = list(page)
+
+    urls = _page_urls(links["last"]["url"]) if "last" in links else []
+    if urls and concurrency > 1:
+        slots = asyncio.Semaphore(concurrency)
+
+        async def fetch(url: str) -> Any:
+            """One page, once a slot is free"""
+            async with slots:
+                return await _async_payload(url, decoder=decoder)
+        for page in await asyncio.gather(*map(fetch, urls)):
+            payload.extend(page)
+        return payload
+
+    url = links.get("next", {}).get("url")
+    while url:
+        page, links = await _async_fetch(url, decoder=decoder)
+        payload.extend(page)
+        url = links.get("next", {}).get("url")
+    return payload
+
+
+class _AsyncMemoized(_Memoized):
+    """Descriptor behind async_memoize.
+    Accessing it on an instance returns an awaitable of the value;
+    ``invalidate(instance)`` is inherited and ``refresh(instance)`` is a
+    coroutine.
+    """
+
+    def __init__(self, fn: Callable, key: Callable = None,
+                 registry: MemoRegistry = None, ttl: float = None,
+                 refresh_after: float = None) -> None:
+        """Init method of _AsyncMemoized"""
+        super().__init__(fn, key=key, registry=registry, ttl=ttl,
+                         refresh_after=refresh_after)
+        self._flight = AsyncSingleFlight()
+        self._tasks = set()
+
+    def __get__(self, instance: Any, owner: type = None) -> Any:
+        """Awaitable of the memoized value of instance"""
+        if instance is None:
+            return self
+        return self._get(instance)
+
+    async def _get(self, instance: Any) -> Any:
+        """Memoized value of instance, awaited once on a miss"""
+        entry = self._load(instance)
+        if entry is not None and self._fresh(entry, None, instance):
+            if self._stale(entry, instance):
+                self._revalidate(instance)
+            return entry.value
+        return await self._flight.do(self._flight_key(instance),
+                                     lambda: self._compute(instance, False))
+
+    async def refresh(self, instance: Any) -> Any:
+        """Recompute the value of instance now and return it"""
+        return await self._flight.do(self._flight_key(instance),
+                                     lambda: self._compute(instance, True))
+
+    def _revalidate(self, instance: Any) -> None:
+        """Refresh the value of instance in a background task, unless a
+        refresh of it is already under way
+        """
+        flight_key = self._flight_key(instance)
+        if flight_key in self._revalidating:
+            return
+        self._revalidating.add(flight_key)
+
+        async def refresh() -> None:
+            """Recompute, keeping the stale value when that fails"""
+            try:
+                await self.refresh(instance)
+            except Exception:
+                pass
+            finally:
+                self._revalidating.discard(flight_key)
+        # hold a reference, the loop only keeps a weak one
+        task = asyncio.ensure_future(refresh())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _compute(self, instance: Any, force: bool) -> Any:
+        """Await and store, unless another caller stored it meanwhile.
+        Recomputing a value already had revalidates with the origin.
+        """
+        entry = self._load(instance)
+        if not force and entry is not None and self._fresh(entry, None,
+                                                           instance):
+            return entry.value
+        # the task running this has its own context, no reset needed
+        _revalidating.set(force or entry is not None)
+        entry = _MemoEntry(_unchanged(entry, await self.fn(instance)))
+        self._store(instance, entry)
+        return entry.value
+
+
+def async_memoize(fn: Callable = None, *,
+                  key: Callable[[Any], Hashable] = None,
+                  registry: MemoRegistry = None, ttl: float = None,
+                  refresh_after: float = None) -> Callable:
+    """Decorator to memoize a coroutine method.
+    The attribute is awaited, ``await obj.a_method``, and the awaited
+    result is stored like memoize stores it, with the same ``key``,
+    ``registry``, ``ttl`` and ``refresh_after`` options, background
+    refreshes running as tasks of the event loop. Concurrent first
+    awaiters share one task running the method; an exception is passed
+    to each of them and not stored.
+    Example
+    -------
+    class MyClass:
+        @async_memoize
+        async def a_method(self):
+            print("a_method called")
+            return 42
+    >>> my_object = MyClass()
+    >>> await my_object.a_method
+    a_method called
+    42
+    >>> await my_object.a_method
+    42
+    """
+    if fn is None:
+        return lambda fn: async_memoize(fn, key=key, registry=registry,
+                                        ttl=ttl, refresh_after=refresh_after)
+    return _AsyncMemoized(fn, key=key, registry=registry, ttl=ttl,
+                          refresh_after=refresh_after)